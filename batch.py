@@ -0,0 +1,224 @@
+import time
+import numpy as np
+import logic
+import machine
+import policy
+import symmetry
+
+# Block index each symmetry takes each canonical index from, the blocks of each line of the 3 x 3 game
+# played in batches and block powers of 3
+PERMS = np.array(symmetry.SYMMETRIES, dtype=np.intp)
+LINES = np.array(list(logic.lines(3, 3)), dtype=np.intp)
+POWERS = np.array(policy.POWERS, dtype=np.int64)
+
+# Canonical code and symmetry of every state code, built on first use
+CANONICAL_CODES = None
+CODE_SYMMETRIES = None
+
+
+def canonical_tables():
+    """Builds the canonical code and symmetry of every state code as arrays
+
+    :return: Canonical codes and symmetries indexed by state code
+    :rtype: tuple of numpy.ndarray
+    """
+    global CANONICAL_CODES, CODE_SYMMETRIES
+
+    if CANONICAL_CODES is None:
+        pairs = [symmetry.canonical(code) for code in range(policy.STATES)]
+        CANONICAL_CODES = np.array([canon for canon, _ in pairs], dtype=np.int64)
+        CODE_SYMMETRIES = np.array([k for _, k in pairs], dtype=np.intp)
+
+    return CANONICAL_CODES, CODE_SYMMETRIES
+
+
+def table_view(store=None):
+    """Gives a writable NumPy view of a game state table without copying it
+
+    :param store: Game state table of the 3 x 3 board, or None for GAMESTATES
+    :type store: policy.PolicyStore
+    :return: STATES x MOVES bead counts
+    :rtype: numpy.ndarray
+    """
+    store = machine.GAMESTATES if store is None else store
+    return np.frombuffer(store.table, dtype=np.int32).reshape(policy.STATES, policy.MOVES)
+
+
+def select(store, boards, temperature=1.0, greedy=False, rng=None):
+    """Picks a move for each of many boards at once without recording or changing anything
+
+    :param store: Game state table to draw beads from
+    :type store: policy.PolicyStore or policy.SparseStore
+    :param boards: Values of each block of each board
+    :type boards: numpy.ndarray or sequence of sequence of int
+    :param temperature: Bead counts are raised to the power of one over it before drawing, so lower
+        temperatures favour the moves with the most beads
+    :type temperature: float
+    :param greedy: Whether to always pick the move with the most beads
+    :type greedy: bool
+    :param rng: Random number generator for the moves
+    :type rng: numpy.random.Generator
+    :return: Index of the chosen block of each board, -1 for boards whose game has ended or that have no beads
+    :rtype: numpy.ndarray
+    """
+    if not greedy and temperature <= 0:
+        raise ValueError('Temperature must be above 0')
+
+    boards = np.asarray(boards, dtype=np.int64).reshape(-1, logic.CELLS)
+    codes = (np.where(boards < 0, 2, boards) * np.array(policy.POWERS, dtype=np.int64)).sum(axis=1)
+
+    if isinstance(store, policy.PolicyStore):
+        canonical_codes, code_symmetries = canonical_tables()
+        symmetries = code_symmetries[codes]
+        counts = table_view(store)[canonical_codes[codes]].astype(np.float64)
+    else:
+        pairs = [symmetry.canonical(code) for code in codes.tolist()]
+        symmetries = np.array([k for _, k in pairs], dtype=np.intp)
+        rows = []
+        for canon, _ in pairs:
+            # Looking a state up with [] adds it, so states not visited yet get their first beads here
+            row = store.get(canon)
+            rows.append(machine.empty_beads(policy.decode(canon), store.beads) if row is None else row)
+        counts = np.array(rows, dtype=np.float64).reshape(-1, logic.CELLS)
+
+    if greedy:
+        choice = counts.argmax(axis=1)
+    else:
+        if temperature != 1:
+            counts **= 1 / temperature
+        totals = counts.cumsum(axis=1)
+        rng = np.random.default_rng() if rng is None else rng
+        picks = rng.random(len(codes)) * totals[:, -1]
+        choice = np.minimum((totals <= picks[:, None]).sum(axis=1), logic.CELLS - 1)
+
+    # Tables migrated from the pickle still hold beads for ended games, so check the boards themselves
+    sums = boards[:, np.array(logic.LINES, dtype=np.intp)].sum(axis=2)
+    ended = (np.abs(sums) == logic.WIN_LENGTH).any(axis=1) | (boards != 0).all(axis=1)
+
+    moves = np.array(symmetry.SYMMETRIES, dtype=np.intp)[symmetries, choice]
+    moves[ended | (counts.sum(axis=1) == 0)] = -1
+
+    return moves
+
+
+def play_batch(games, rng):
+    """Plays a batch of machine against machine games in lockstep and updates the table at the end
+
+    :param games: Number of games to play at once
+    :type games: int
+    :param rng: Random number generator for the moves
+    :type rng: numpy.random.Generator
+    :return: Result of each game: 1 for a crosses win, -1 for a naughts win and 0 for a draw
+    :rtype: numpy.ndarray
+    """
+    canonical_codes, code_symmetries = canonical_tables()
+    table = table_view()
+
+    boards = np.zeros((games, 9), dtype=np.int8)
+    codes = np.zeros(games, dtype=np.int64)
+    results = np.zeros(games, dtype=np.int8)
+    plies = np.zeros(games, dtype=np.intp)
+    active = np.arange(games)
+
+    # Canonical state and canonical move of every game at every ply
+    states = np.zeros((9, games), dtype=np.int64)
+    moves = np.zeros((9, games), dtype=np.intp)
+
+    for ply in range(9):
+        side = 1 if ply % 2 == 0 else -1
+        digit = policy.DIGITS[side]
+
+        canon = canonical_codes[codes[active]]
+        counts = table[canon].cumsum(axis=1)
+        picks = rng.random(len(active)) * counts[:, -1]
+        choice = np.minimum((counts <= picks[:, None]).sum(axis=1), 8)
+
+        move = PERMS[code_symmetries[codes[active]], choice]
+        boards[active, move] = side
+        codes[active] += digit * POWERS[move]
+        states[ply, active] = canon
+        moves[ply, active] = choice
+        plies[active] += 1
+
+        # Only the side that just moved can have completed a line
+        won = (boards[active][:, LINES].sum(axis=2) == 3 * side).any(axis=1)
+        results[active[won]] = side
+        active = active[~won]
+
+    rows = np.unique(states[np.arange(9)[:, None] < plies])
+    before = table[rows]
+
+    for ply in range(9):
+        side = 1 if ply % 2 == 0 else -1
+        played = plies > ply
+        delta = np.where(results == side, 3, np.where(results == 0, 1, -1))
+        np.add.at(table, (states[ply, played], moves[ply, played]), delta[played])
+
+    refill(table, rows)
+
+    changed = table[rows] - before
+    row, column = np.nonzero(changed)
+    machine.record(list(zip((rows[row] * 9 + column).tolist(), changed[row, column].tolist())))
+
+    return results
+
+
+def refill(table, rows):
+    """Clamps negative bead counts of the given rows and refills rows left without beads
+
+    :param table: STATES x MOVES bead counts
+    :type table: numpy.ndarray
+    :param rows: Codes of the rows to check
+    :type rows: numpy.ndarray
+    """
+    counts = np.maximum(table[rows], 0)
+    empty = counts.sum(axis=1) == 0
+    if empty.any():
+        blocks = rows[empty, None] // POWERS % 3
+        counts[empty] = blocks == 0
+
+    table[rows] = counts
+
+
+def train(games=None, seconds=None, size=10000, seed=None, save_every=10000, monitor=None):
+    """Trains the game state table by playing batches of games in lockstep
+
+    :param games: Number of games to play
+    :type games: int
+    :param seconds: Time budget in seconds
+    :type seconds: float
+    :param size: Number of games in each batch
+    :type size: int
+    :param seed: Seed for the random moves
+    :type seed: int
+    :param save_every: Games between saves of the policy file
+    :type save_every: int
+    :param monitor: Analytics to pass the results of each batch to, which may stop training early
+    :type monitor: metrics.Monitor
+    :return: Number of games played and seconds taken
+    :rtype: tuple
+    """
+    if (logic.SIZE, logic.WIN_LENGTH) != (3, 3):
+        raise ValueError('Batches can only be played on the 3 x 3 board with 3 in a row')
+
+    rng = np.random.default_rng(seed)
+    canonical_tables()
+
+    start = time.perf_counter()
+    deadline = start + seconds if seconds else None
+
+    count = 0
+    while (games is None or count < games) and (deadline is None or time.perf_counter() < deadline):
+        batch = size if games is None else min(size, games - count)
+        results = play_batch(batch, rng)
+        previous, count = count, count + batch
+
+        if save_every and count // save_every > previous // save_every:
+            machine.save_policy()
+
+        if monitor is not None:
+            monitor.add(int((results == 1).sum()), int((results == 0).sum()), int((results == -1).sum()))
+            if monitor.stopped:
+                break
+
+    return count, time.perf_counter() - start
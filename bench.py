@@ -0,0 +1,182 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import timeit
+import logic
+import machine
+import policy
+import train
+
+
+def best_of(statement, number, repeat=5):
+    """Times a statement, keeping the fastest of several runs
+
+    :param statement: Statement to time
+    :type statement: callable
+    :param number: Calls in each run
+    :type number: int
+    :param repeat: Number of runs
+    :type repeat: int
+    :return: Seconds per call
+    :rtype: float
+    """
+    return min(timeit.repeat(statement, number=number, repeat=repeat)) / number
+
+
+def sample_positions(count):
+    """Plays random games to collect positions that have not ended
+
+    :param count: Number of positions
+    :type count: int
+    :return: Values of each block of each position
+    :rtype: list of list of logic.State
+    """
+    positions = []
+    while len(positions) < count:
+        board = [logic.State.EMPTY] * 9
+        turn = logic.State.CROSS
+        for i in random.sample(range(9), 9):
+            if logic.check_end([board[:3], board[3:6], board[6:]]) != logic.Win.NOT_END:
+                break
+            positions.append(list(board))
+            board[i] = turn
+            turn = logic.State.NAUGHT if turn == logic.State.CROSS else logic.State.CROSS
+
+    return positions[:count]
+
+
+def bench_check_end(positions):
+    arrays = [[board[:3], board[3:6], board[6:]] for board in positions]
+
+    def run():
+        for array in arrays:
+            logic.check_end(array)
+
+    return best_of(run, 10) / len(arrays) * 1e9
+
+
+def bench_think(positions):
+    player = machine.Machine()
+    games = []
+    for board in positions:
+        game = logic.Game()
+        crosses = [i for i, x in enumerate(board) if x == logic.State.CROSS]
+        naughts = [i for i, x in enumerate(board) if x == logic.State.NAUGHT]
+        for i in range(len(crosses)):
+            game.play(crosses[i])
+            if i < len(naughts):
+                game.play(naughts[i])
+        games.append(game)
+
+    def run():
+        for game in games:
+            player.think(game)
+            game.undo()
+        player.played = {}
+
+    return best_of(run, 10) / len(games) * 1e6
+
+
+def bench_self_play(games):
+    count, elapsed = train.train(games, save_every=0)
+    return count / elapsed
+
+
+def bench_policy_files(trained):
+    """Times loading and saving the policy file for tables trained for different numbers of games
+
+    :param trained: Numbers of games to train each table for
+    :type trained: list of int
+    :return: Milliseconds to load, save and map the policy file for each number of games
+    :rtype: dict
+    """
+    results = {}
+    for games in trained:
+        machine.update_policy()
+        train.train(games, save_every=0)
+        machine.compact()
+
+        results[str(games)] = {
+            'load_ms': best_of(machine.load_policy, 1) * 1e3,
+            'save_ms': best_of(machine.compact, 1) * 1e3,
+            'map_ms': best_of(lambda: policy.PolicyStore.open(machine.POLICY_FILE)[0].close(), 1) * 1e3,
+        }
+
+    return results
+
+
+def commit():
+    """Finds the commit being benchmarked
+
+    :return: Commit hash, or None outside a git checkout
+    :rtype: str
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(games, trained, seed):
+    """Runs every benchmark in a scratch directory so no policy files are touched
+
+    :param games: Number of self-play games to time
+    :type games: int
+    :param trained: Numbers of games to train tables for before timing the policy files
+    :type trained: list of int
+    :param seed: Seed for the positions and moves
+    :type seed: int
+    :return: Results of each benchmark
+    :rtype: dict
+    """
+    random.seed(seed)
+    positions = sample_positions(1000)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch, contextlib.redirect_stdout(sys.stderr):
+        os.chdir(scratch)
+        try:
+            machine.update_policy()
+            results = {
+                'commit': commit(),
+                'python': platform.python_version(),
+                'check_end_ns': bench_check_end(positions),
+                'think_us': bench_think(positions),
+                'self_play_games_per_s': bench_self_play(games),
+                'policy_file': bench_policy_files(trained),
+            }
+        finally:
+            if machine.JOURNAL is not None:
+                machine.JOURNAL.close()
+                machine.JOURNAL = None
+            os.chdir(cwd)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the game and learning hot paths')
+    parser.add_argument('-n', '--games', type=int, default=20000, help='self-play games to time')
+    parser.add_argument('--trained', type=int, nargs='+', default=[0, 10000, 100000],
+                        help='games to train tables for before timing the policy files')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the positions and moves')
+    parser.add_argument('-o', '--output', help='file to write the JSON results to instead of printing them')
+    args = parser.parse_args()
+
+    results = json.dumps(run(args.games, args.trained, args.seed), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(results + '\n')
+    else:
+        print(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+
+def percentile(values, share):
+    """Finds the value below which a share of the values fall
+
+    :param values: Sorted values
+    :type values: list of float
+    :param share: Share between 0 and 1
+    :type share: float
+    :return: Value at the share, or 0 if there are no values
+    :rtype: float
+    """
+    if not values:
+        return 0.0
+
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+async def request(reader, writer, line):
+    writer.write((line + '\n').encode())
+    await writer.drain()
+
+    return (await reader.readline()).decode().split()
+
+
+async def session(connect, games, latencies, rng):
+    """Plays random moves against the server for a number of games over one connection
+
+    :param connect: Opens a connection to the server
+    :type connect: callable
+    :param games: Number of games to play
+    :type games: int
+    :param latencies: Seconds taken by each request, added to as they are made
+    :type latencies: list of float
+    :param rng: Random number generator for the moves
+    :type rng: random.Random
+    :return: Number of games finished
+    :rtype: int
+    """
+    reader, writer = await connect()
+    _, size, _ = (await reader.readline()).decode().split()
+    cells = int(size) ** 2
+
+    finished = 0
+    try:
+        for _ in range(games):
+            empty = set(range(cells))
+            line = 'NEW ' + rng.choice('XO')
+            while True:
+                start = time.perf_counter()
+                reply = await request(reader, writer, line)
+                latencies.append(time.perf_counter() - start)
+
+                if reply[0] == 'ERR':
+                    raise RuntimeError(' '.join(reply))
+                if reply[-1] != '-':
+                    empty.discard(int(reply[-1]))
+                if reply[0] == 'END':
+                    break
+
+                move = rng.choice(sorted(empty))
+                empty.discard(move)
+                line = f'PLAY {move}'
+
+            finished += 1
+
+        writer.write(b'QUIT\n')
+        await writer.drain()
+    finally:
+        writer.close()
+
+    return finished
+
+
+async def run(host, port, path, sessions, games, seed):
+    """Opens many connections at once, each playing games against the server
+
+    :param host: Address of the server
+    :type host: str
+    :param port: Port of the server
+    :type port: int
+    :param path: Path of the server's local socket, used instead of TCP if given
+    :type path: str
+    :param sessions: Number of connections open at once
+    :type sessions: int
+    :param games: Games to play over each connection
+    :type games: int
+    :param seed: Seed for the moves
+    :type seed: int
+    :return: Games played, games per second and request latencies
+    :rtype: dict
+    """
+    if path:
+        def connect():
+            return asyncio.open_unix_connection(path)
+    else:
+        def connect():
+            return asyncio.open_connection(host, port)
+
+    latencies = []
+    start = time.perf_counter()
+    finished = await asyncio.gather(*(session(connect, games, latencies, random.Random(seed + i))
+                                      for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'sessions': sessions,
+        'games': sum(finished),
+        'elapsed_s': elapsed,
+        'games_per_s': sum(finished) / elapsed,
+        'requests': len(latencies),
+        'latency_p50_ms': percentile(latencies, 0.5) * 1e3,
+        'latency_p99_ms': percentile(latencies, 0.99) * 1e3,
+        'latency_max_ms': latencies[-1] * 1e3 if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate load on the game server and report its throughput')
+    parser.add_argument('--host', default='127.0.0.1', help='address of the server')
+    parser.add_argument('--port', type=int, default=7878, help='port of the server')
+    parser.add_argument('--unix', help="path of the server's local socket to connect to instead of TCP")
+    parser.add_argument('-c', '--sessions', type=int, default=100, help='connections open at once')
+    parser.add_argument('-n', '--games', type=int, default=100, help='games to play over each connection')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the moves')
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args.host, args.port, args.unix, args.sessions, args.games, args.seed)),
+                     indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import random
+import struct
+import policy
+import symmetry
+
+FROZEN_FILE = 'GAMESTATES.frozen'
+
+# File header: magic, layout version, blocks and moves kept for each state, followed by
+# that many bytes for each state code with the moves best first
+HEADER = struct.Struct('<4sIII')
+MAGIC = b'MNCF'
+VERSION = 1
+
+# Byte of states with no move, such as games that have ended
+NO_MOVE = 0xFF
+
+
+def compile_table(store, top=1):
+    """Compiles the moves with the most beads of every state code into a flat table
+
+    Moves are stored for the state code as played, not its canonical code, so looking one up
+    needs no symmetries.
+
+    :param store: Game state table of the 3 x 3 board
+    :type store: policy.PolicyStore
+    :param top: Number of moves kept for each state
+    :type top: int
+    :return: top bytes for each state code with the moves best first and NO_MOVE after the last move
+    :rtype: bytes
+    """
+    if not isinstance(store, policy.PolicyStore):
+        raise ValueError('Only the table of the 3 x 3 board can be frozen')
+
+    table = bytearray([NO_MOVE]) * (policy.STATES * top)
+    for code in range(policy.STATES):
+        canon, k = symmetry.canonical(code)
+        counts = store[canon]
+        ranked = sorted((i for i in range(policy.MOVES) if counts[i] > 0), key=lambda i: -counts[i])
+
+        for j, move in enumerate(ranked[:top]):
+            table[code * top + j] = symmetry.from_canonical(move, k)
+
+    return bytes(table)
+
+
+def export(store, path=FROZEN_FILE, top=1):
+    """Writes the compiled moves of a game state table to a file
+
+    :param store: Game state table of the 3 x 3 board
+    :type store: policy.PolicyStore
+    :param path: Path of the file
+    :type path: str
+    :param top: Number of moves kept for each state
+    :type top: int
+    """
+    table = compile_table(store, top)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, policy.MOVES, top))
+        f.write(table)
+
+
+def load(path=FROZEN_FILE):
+    """Reads a file written by export
+
+    :param path: Path of the file
+    :type path: str
+    :return: Moves of each state code and the number kept for each state
+    :rtype: tuple
+    """
+    with open(path, 'rb') as f:
+        magic, version, cells, top = HEADER.unpack(f.read(HEADER.size))
+        table = f.read()
+
+    if magic != MAGIC or version != VERSION or cells != policy.MOVES or len(table) != policy.STATES * top:
+        raise ValueError('Not a frozen table of this layout')
+
+    return table, top
+
+
+class Frozen:
+    """Player looking its moves up in a frozen table, without any learning state
+
+    With one move kept for each state it always plays the move with the most beads, otherwise
+    it picks at random among the moves kept.
+
+    :param path: Path of the file written by export
+    :type path: str
+    """
+
+    def __init__(self, path=FROZEN_FILE):
+        self.table, self.top = load(path)
+
+    def choose(self, code):
+        """Look up a move for a game state
+
+        :param code: State code of the blocks
+        :type code: int
+        :return: Index of the chosen block
+        :rtype: int
+        """
+        if self.top == 1:
+            move = self.table[code]
+        else:
+            start = code * self.top
+            moves = self.table[start:start + self.top].rstrip(bytes([NO_MOVE]))
+            move = random.choice(moves) if moves else NO_MOVE
+
+        if move == NO_MOVE:
+            raise ValueError(f'No move frozen for state {code}')
+
+        return move
+
+    def think(self, game):
+        """Play the frozen move
+
+        :param game: Game to play in
+        :type game: logic.Game
+        :return: Index of the played block
+        :rtype: int
+        """
+        choice = self.choose(game.code)
+        game.play(choice)
+
+        return choice
+
+    def reward(self):
+        pass
+
+    def punish(self):
+        pass
+
+    def draw(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Freeze the machine's policy into a table of its best moves")
+    parser.add_argument('-o', '--output', default=FROZEN_FILE, help='file to write the frozen table to')
+    parser.add_argument('-k', '--top', type=int, default=1, help='number of best moves kept for each state')
+    args = parser.parse_args()
+
+    if not 1 <= args.top <= policy.MOVES:
+        parser.error(f'--top must be between 1 and {policy.MOVES}')
+
+    # Only exporting needs the learner. The logic module imports machine and machine imports logic,
+    # so logic has to be imported first for the cycle to resolve, even though it is not used here
+    import logic  # noqa: F401
+    import machine
+    machine.load_policy()
+    export(machine.GAMESTATES, args.output, args.top)
+
+    print(f'Froze {policy.STATES} states into {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,16 @@
+import argparse
 import pygame
 import os
+import sys
+import gamelog
 import logic
 import machine
+import stats
 
 # Centre window on screen
 os.environ['SDL_VIDEO_CENTERED'] = '1'
 
-# Constants (size and colour)
+# Constants (size and colour), with BLOCK the size of the blocks of the 3 x 3 board
 BLOCK = 150
 GAP = 10
 BORDER = 50
@@ -15,6 +19,52 @@ WIN_SIZE = 3 * BLOCK + 2 * GAP + 2 * BORDER
 BLOCK_COLOUR = (20, 189, 172)
 BACKGROUND_COLOUR = (13, 161, 146)
 
+# Fonts and rendered text, created once for each size and text
+FONTS = {}
+TEXTS = {}
+
+
+def block_size():
+    """Getter for the size of each block, shrinking the blocks of larger boards to fit the window
+
+    :return: Width and height of each block in pixels
+    :rtype: int
+    """
+    return (WIN_SIZE - 2 * BORDER - (logic.SIZE - 1) * GAP) // logic.SIZE
+
+
+def font(size):
+    """Getter for the font of each size, loading it the first time
+
+    :param size: Font size
+    :type size: int
+    :return: Font
+    :rtype: pygame.font.Font
+    """
+    if size not in FONTS:
+        FONTS[size] = pygame.font.Font('sourcesanspro.ttf', size)
+
+    return FONTS[size]
+
+
+def render(text, size, colour):
+    """Renders text, reusing the surface rendered the first time
+
+    :param text: Text to render
+    :type text: str
+    :param size: Font size
+    :type size: int
+    :param colour: Colour of the text
+    :type colour: tuple
+    :return: Rendered text
+    :rtype: pygame.Surface
+    """
+    key = (text, size, colour)
+    if key not in TEXTS:
+        TEXTS[key] = font(size).render(text, 1, colour)
+
+    return TEXTS[key]
+
 
 class Button:
     def __init__(self, x, y, width, height, human_colour, computer_colour, computer=False, onclick=None):
@@ -28,12 +78,10 @@ class Button:
 
         if onclick:
             self.onclick = onclick
-            self.font = pygame.font.Font('sourcesanspro.ttf', 100)
-            self.text = self.font.render('Play', 1, (100, 100, 100))
+            self.text = render('Play', 100, (100, 100, 100))
         else:
             self.onclick = self.switch
-            self.font = pygame.font.Font('sourcesanspro.ttf', 40)
-            self.text = self.font.render('Human', 1, (200, 200, 200))
+            self.text = render('Human', 40, (200, 200, 200))
 
         if computer:
             self.switch()
@@ -51,11 +99,11 @@ class Button:
     def switch(self):
         self.human = self.human.switch()
         if self.human == logic.Player.HUMAN:
-            self.font = pygame.font.Font('sourcesanspro.ttf', 40)
-            self.text = self.font.render('Human', 1, (200, 200, 200))
+            self.text = render('Human', 40, (200, 200, 200))
+        elif self.human == logic.Player.COMPUTER:
+            self.text = render('Computer', 30, (200, 200, 200))
         else:
-            self.font = pygame.font.Font('sourcesanspro.ttf', 30)
-            self.text = self.font.render('Computer', 1, (200, 200, 200))
+            self.text = render('Solver', 40, (200, 200, 200))
 
         self.text_rect = self.text.get_rect()
         self.text_rect.center = (self.x + self.width // 2, self.y + self.height // 2 + self.human.get_offset())
@@ -80,17 +128,27 @@ class Block:
     def __init__(self, rect):
         self.rect = rect
         self.state = logic.State.EMPTY  # Block is initialised empty
+        self.dirty = True  # Block needs drawing
 
     def draw(self):
         """Draws the block to the Pygame window
+
+        :return: The area drawn to
+        :rtype: tuple
         """
         pygame.draw.rect(tictactoe.win, BLOCK_COLOUR, self.rect)
         if self.state != logic.State.EMPTY:
-            text = tictactoe.symbol_font.render(self.state.get_symbol(), 1, self.state.get_colour())
+            size = self.rect[2]
+            text = render(self.state.get_symbol(), 200 * size // BLOCK, self.state.get_colour())
             text_rect = text.get_rect()
             text_rect.center = (self.rect[0] + self.rect[2] // 2,
-                                self.rect[1] + self.rect[3] // 2 + self.state.get_offset())
-            tictactoe.win.blit(text, text_rect)
+                                self.rect[1] + self.rect[3] // 2 + self.state.get_offset() * size // BLOCK)
+            # Keep the symbol inside the block so redrawing only the block leaves nothing behind
+            clipped = text_rect.clip(self.rect)
+            tictactoe.win.blit(text, clipped, clipped.move(-text_rect.x, -text_rect.y))
+
+        self.dirty = False
+        return self.rect
 
     def clicked(self, location):
         """Check if a mouse click was inside a rectangle
@@ -112,6 +170,7 @@ class Block:
         :type state: logic.State
         """
         self.state = state
+        self.dirty = True
 
 
 class GameHandler:
@@ -123,16 +182,16 @@ class GameHandler:
     player2 = logic.Player.COMPUTER
     automated = False
     winner = None
+    redraw = True
+    log = None  # Game log to append finished games to
 
     def __init__(self):
         pygame.init()
         self.win = pygame.display.set_mode((WIN_SIZE, WIN_SIZE))
         pygame.display.set_caption('Tic Tac Toe')
 
-        self.symbol_font = pygame.font.Font('sourcesanspro.ttf', 200)
-        self.medium_symbol_font = pygame.font.Font('sourcesanspro.ttf', 400)
-        self.large_symbol_font = pygame.font.Font('sourcesanspro.ttf', 600)
-        self.text_font = pygame.font.Font('sourcesanspro.ttf', 50)
+        self.end_screens = {}  # End screen of each result, drawn the first time it is shown
+        self.game = logic.Game()  # Board, side to move and result of the game being played
 
         self.reset()
 
@@ -142,17 +201,24 @@ class GameHandler:
         :param location: Position of the mouse click
         :type location: tuple
         :param player: Player to move
-        :type player: logic.Human or machine.Machine
+        :type player: logic.Human or machine.Machine or solver.Solver
         """
+        move = None
         if type(player) == logic.Human:
-            for block in self.blocks:
-                if block.clicked(location):
-                    player.think(block)
-        elif type(player) == machine.Machine:
-            player.think(self.blocks)
+            for i, block in enumerate(self.blocks):
+                if block.clicked(location) and player.think(self.game, i):
+                    move = i
+        else:
+            move = player.think(self.game)
+
+        if move is not None:
+            self.blocks[move].set_state(self.game.cells[move])
 
-        self.winner = logic.check_end(self.array())
+        self.winner = self.game.result
         if self.winner != logic.Win.NOT_END:
+            if self.log is not None:
+                self.log.add(self.game.history, self.winner)
+
             if self.winner == logic.Win.CROSS_WIN:
                 self.player1.reward()
                 self.player2.punish()
@@ -165,29 +231,27 @@ class GameHandler:
 
             return True
 
-    def array(self):
-        """Converts the blocks into an 2 dimensional state array
+    def end_screen(self):
+        """Getter for the end screen of the result, drawing it the first time
 
-        :return: 3 x 3 list of State objects
-        :rtype: list of logic.State
+        :return: End screen
+        :rtype: pygame.Surface
         """
-        blocks = [self.blocks[:3], self.blocks[3:6], self.blocks[6:]]
-        return [[(lambda x: x.state)(block) for block in row] for row in blocks]
+        if self.winner.name in self.end_screens:
+            return self.end_screens[self.winner.name]
 
-    def end(self):
-        """End screen loop and reset
-        """
-        self.win.fill(BACKGROUND_COLOUR)
+        screen = pygame.Surface((WIN_SIZE, WIN_SIZE))
+        screen.fill(BACKGROUND_COLOUR)
 
-        text = self.text_font.render(self.winner.value, 1, self.winner.get_colour())
+        text = render(self.winner.value, 50, self.winner.get_colour())
         text_rect = text.get_rect()
         text_rect.center = (WIN_SIZE // 2, WIN_SIZE // 2 + 150)
 
         if self.winner != logic.Win.DRAW:
-            symbol = self.large_symbol_font.render(self.winner.get_symbol(), 1, self.winner.get_colour())
+            symbol = render(self.winner.get_symbol(), 600, self.winner.get_colour())
             symbol_rect = symbol.get_rect()
             symbol_rect.center = (WIN_SIZE // 2, WIN_SIZE // 2 + self.winner.get_offset())
-            self.win.blit(symbol, symbol_rect)
+            screen.blit(symbol, symbol_rect)
 
         else:
             naught_win = logic.Win.NAUGHT_WIN
@@ -196,8 +260,8 @@ class GameHandler:
             naught_offset = naught_win.get_offset() + 20
             cross_offset = cross_win.get_offset()
 
-            naught = self.medium_symbol_font.render(naught_win.get_symbol(), 1, naught_win.get_colour())
-            cross = self.medium_symbol_font.render(cross_win.get_symbol(), 1, cross_win.get_colour())
+            naught = render(naught_win.get_symbol(), 400, naught_win.get_colour())
+            cross = render(cross_win.get_symbol(), 400, cross_win.get_colour())
 
             naught_rect = naught.get_rect()
             cross_rect = cross.get_rect()
@@ -205,24 +269,32 @@ class GameHandler:
             naught_rect.center = (WIN_SIZE // 2 + 100, WIN_SIZE // 2 + naught_offset)
             cross_rect.center = (WIN_SIZE // 2 - 100, WIN_SIZE // 2 + cross_offset)
 
-            self.win.blit(naught, naught_rect)
-            self.win.blit(cross, cross_rect)
+            screen.blit(naught, naught_rect)
+            screen.blit(cross, cross_rect)
+
+        screen.blit(text, text_rect)
+        self.end_screens[self.winner.name] = screen
+
+        return screen
 
-        self.win.blit(text, text_rect)
+    def end(self):
+        """End screen loop and reset
+        """
+        self.win.blit(self.end_screen(), (0, 0))
+        pygame.display.update()
 
+        # The end screen does not change, so wait for events instead of redrawing it
         run = True
         while run:
-            for e in pygame.event.get():
-                if e.type == pygame.QUIT:
-                    machine.save_pickle()
-                    run = False
-                    pygame.quit()
-                    quit()
-
-                elif e.type == pygame.KEYDOWN:
-                    run = False
+            e = pygame.event.wait()
+            if e.type == pygame.QUIT:
+                machine.save_policy()
+                run = False
+                pygame.quit()
+                quit()
 
-            pygame.display.update()
+            elif e.type == pygame.KEYDOWN:
+                run = False
 
     def reset(self):
         """Resets the GameHandler to play again
@@ -232,36 +304,57 @@ class GameHandler:
 
         # Instantiate all blocks in an array
         self.blocks = []
-        for x in range(3):
-            for y in range(3):
-                self.blocks.append(Block((BLOCK * x + GAP * x + BORDER, BLOCK * y + GAP * y + BORDER, BLOCK, BLOCK)))
+        size = block_size()
+        for x in range(logic.SIZE):
+            for y in range(logic.SIZE):
+                self.blocks.append(Block((size * x + GAP * x + BORDER, size * y + GAP * y + BORDER, size, size)))
 
-        logic.TURN = logic.Turn.CROSS
+        self.game.reset()
         self.player1 = logic.Player.COMPUTER
         self.player2 = logic.Player.COMPUTER
         self.winner = None
+        self.redraw = True
 
         if not self.automated:
             self.buttons = []
 
+    def to_move(self):
+        """Getter for the player whose turn it is
+
+        :return: Player to move
+        :rtype: logic.Human or machine.Machine or solver.Solver
+        """
+        return self.player1 if self.game.turn == logic.State.CROSS else self.player2
+
     def set_players(self):
-        self.player1 = self.buttons[0].human.value
-        self.player2 = self.buttons[1].human.value
+        self.player1 = self.buttons[0].human.get_player()
+        self.player2 = self.buttons[1].human.get_player()
 
-        if isinstance(self.player1, machine.Machine) and isinstance(self.player2, machine.Machine):
+        # A machine playing itself needs the moves of each side kept apart to learn from them
+        if self.player2 is self.player1 and isinstance(self.player1, machine.Machine):
+            self.player2 = machine.Machine()
+
+        if not isinstance(self.player1, logic.Human) and not isinstance(self.player2, logic.Human):
             self.automated = True
 
         return True
 
     def draw(self):
-        """Draws all blocks
+        """Draws all blocks after a reset and afterwards only the blocks that changed
         """
-        self.win.fill(BACKGROUND_COLOUR)
+        if self.redraw:
+            self.win.fill(BACKGROUND_COLOUR)
 
-        for block in self.blocks:
-            block.draw()
+            for block in self.blocks:
+                block.draw()
 
-        pygame.display.update()
+            pygame.display.update()
+            self.redraw = False
+            return
+
+        rects = [block.draw() for block in self.blocks if block.dirty]
+        if rects:
+            pygame.display.update(rects)
 
     def gameloop(self):
         """Main game loop
@@ -274,46 +367,27 @@ class GameHandler:
 
             for e in pygame.event.get():
                 if e.type == pygame.QUIT:
-                    machine.save_pickle()
+                    machine.save_policy()
                     run = False
                     pygame.quit()
                     quit()
 
-                if e.type == pygame.MOUSEBUTTONDOWN:
-                    if logic.TURN.name == 'CROSS':
-                        if type(self.player1) == logic.Human:
-                            if self.click(self.player1, pygame.mouse.get_pos()):
-                                self.winner = logic.Win.CROSS_WIN
-                                run = False
-                    else:
-                        if type(self.player2) == logic.Human:
-                            if self.click(self.player2, pygame.mouse.get_pos()):
-                                self.winner = logic.Win.NAUGHT_WIN
-                                run = False
+                player = self.to_move()
+                if e.type == pygame.MOUSEBUTTONDOWN and type(player) == logic.Human:
+                    if self.click(player, pygame.mouse.get_pos()):
+                        run = False
+                        break
 
-                if e.type == pygame.KEYDOWN:
-                    if logic.TURN.name == 'CROSS':
-                        if type(self.player1) == machine.Machine:
-                            if self.click(self.player1):
-                                self.winner = logic.Win.CROSS_WIN
-                                run = False
-                    else:
-                        if type(self.player2) == machine.Machine:
-                            if self.click(self.player2):
-                                self.winner = logic.Win.NAUGHT_WIN
-                                run = False
-
-            if self.automated:
-                if logic.TURN.name == 'CROSS':
-                    if type(self.player1) == machine.Machine:
-                        if self.click(self.player1):
-                            self.winner = logic.Win.CROSS_WIN
-                            run = False
-                else:
-                    if type(self.player2) == machine.Machine:
-                        if self.click(self.player2):
-                            self.winner = logic.Win.NAUGHT_WIN
-                            run = False
+                if e.type == pygame.KEYDOWN and type(player) != logic.Human:
+                    if self.click(player):
+                        run = False
+                        break
+
+            if run and self.automated:
+                player = self.to_move()
+                if type(player) != logic.Human:
+                    if self.click(player):
+                        run = False
 
             self.draw()
 
@@ -331,7 +405,7 @@ class GameHandler:
         while run:
             for e in pygame.event.get():
                 if e.type == pygame.QUIT:
-                    machine.save_pickle()
+                    machine.save_policy()
                     run = False
                     pygame.quit()
                     quit()
@@ -365,7 +439,9 @@ class GameHandler:
             self.reset()
 
         if count % 100 == 0:
-            machine.save_pickle()
+            machine.save_policy()
+            if self.log is not None:
+                self.log.flush()
 
     def main(self):
         for i in range(10000):
@@ -373,6 +449,22 @@ class GameHandler:
 
 
 if __name__ == '__main__':
-    machine.load_pickle()
+    parser = argparse.ArgumentParser(description='Play noughts and crosses against the machine')
+    parser.add_argument('--size', type=int, default=3, help='number of blocks along each side of the board')
+    parser.add_argument('--win-length', type=int, default=3, help='number of blocks in a row needed to win')
+    parser.add_argument('--log', help='game log to append every finished game to')
+    args = parser.parse_args()
+
+    machine.configure(args.size, args.win_length)
+    stats.setup({'game': sys.modules[__name__]})
+    machine.load_policy()
     tictactoe = GameHandler()
-    tictactoe.main()
+    if args.log:
+        tictactoe.log = gamelog.GameLog(args.log)
+
+    # Quitting the window exits from inside the game loops, so the log is closed on the way out
+    try:
+        tictactoe.main()
+    finally:
+        if tictactoe.log is not None:
+            tictactoe.log.close()
@@ -0,0 +1,174 @@
+import argparse
+import os
+import struct
+import logic
+import machine
+import policy
+import symmetry
+
+# File header: magic, layout version and blocks on the board, followed by one fixed size record per game
+# of the result and the block played on each move, with NO_MOVE after the last move
+HEADER = struct.Struct('<4sII')
+MAGIC = b'MNCG'
+VERSION = 1
+NO_MOVE = 0xFF
+
+# Byte of each result
+RESULTS = {'DRAW': 0, 'CROSS_WIN': 1, 'NAUGHT_WIN': 2}
+WINS = (logic.Win.DRAW, logic.Win.CROSS_WIN, logic.Win.NAUGHT_WIN)
+
+# Bytes written to or read from the file at once
+BUFFER = 1 << 16
+
+
+def record_size(cells):
+    """Size of the record of each game
+
+    :param cells: Number of blocks on the board
+    :type cells: int
+    :return: Size in bytes
+    :rtype: int
+    """
+    return 1 + cells
+
+
+class GameLog:
+    """Buffered writer appending a record of each finished game to a log file
+
+    A record torn by a crash at the end of an existing log is dropped before appending. The log is then
+    opened for appending, so several processes can share one log with every write landing at its end.
+
+    :param path: Path of the log
+    :type path: str
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.cells = logic.CELLS
+        size = record_size(self.cells)
+
+        if not os.path.exists(path) or os.path.getsize(path) < HEADER.size:
+            with open(path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, self.cells))
+
+        with open(path, 'r+b') as f:
+            magic, version, cells = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION or cells != self.cells:
+                raise ValueError('Not a game log of this board size')
+
+            length = f.seek(0, os.SEEK_END)
+            f.truncate(length - (length - HEADER.size) % size)
+
+        # Records are buffered here and written whole in one call, so those of other processes are never split
+        self.file = open(path, 'ab', buffering=0)
+        self.pending = bytearray()
+
+    def add(self, moves, result):
+        """Appends the record of a finished game
+
+        :param moves: Blocks played on each move, crosses first
+        :type moves: list of int
+        :param result: Result of the game
+        :type result: logic.Win
+        """
+        self.pending += bytes([RESULTS[result.name], *moves]) + bytes([NO_MOVE]) * (self.cells - len(moves))
+        if len(self.pending) >= BUFFER:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.file.write(self.pending)
+            self.pending.clear()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def read(path):
+    """Streams the records of a log, skipping a torn record at the end
+
+    :param path: Path of the log
+    :type path: str
+    :return: Blocks played on each move and the result of each game
+    :rtype: generator of tuple
+    """
+    with open(path, 'rb') as f:
+        magic, version, cells = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or cells != logic.CELLS:
+            raise ValueError('Not a game log of this board size')
+
+        size = record_size(cells)
+        chunk = BUFFER // size * size
+        while True:
+            data = f.read(chunk)
+            for start in range(0, len(data) - size + 1, size):
+                yield data[start + 1:start + size].rstrip(b'\xff'), WINS[data[start]]
+
+            if len(data) < chunk:
+                break
+
+
+def replay(path, store=None):
+    """Teaches the game state table every game of a log as if the machine had played both sides
+
+    :param path: Path of the log
+    :type path: str
+    :param store: Game state table to teach, or None for GAMESTATES
+    :type store: policy.PolicyStore or policy.SparseStore
+    :return: Number of games replayed
+    :rtype: int
+    """
+    players = machine.Machine(store), machine.Machine(store)
+    digits = policy.DIGITS[logic.State.CROSS], policy.DIGITS[logic.State.NAUGHT]
+    powers = policy.POWERS
+
+    count = 0
+    for moves, result in read(path):
+        code = 0
+        for ply, move in enumerate(moves):
+            canon, k = symmetry.canonical(code)
+            players[ply % 2].played[canon] = symmetry.to_canonical(move, k)
+            code += digits[ply % 2] * powers[move]
+
+        crosses, naughts = players
+        if result == logic.Win.CROSS_WIN:
+            crosses.reward()
+            naughts.punish()
+        elif result == logic.Win.NAUGHT_WIN:
+            crosses.punish()
+            naughts.reward()
+        else:
+            crosses.draw()
+            naughts.draw()
+
+        count += 1
+
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teach the machine the games of game logs')
+    parser.add_argument('logs', nargs='+', help='game logs to replay')
+    parser.add_argument('--fresh', action='store_true', help='start from fresh beads instead of the current policy')
+    parser.add_argument('--size', type=int, default=3, help='number of blocks along each side of the board')
+    parser.add_argument('--win-length', type=int, default=3, help='number of blocks in a row needed to win')
+    args = parser.parse_args()
+
+    machine.configure(args.size, args.win_length)
+    machine.load_policy()
+    if args.fresh:
+        machine.GAMESTATES = machine.fresh_store()
+
+    # The whole table is written once at the end, so journaling each game would only slow replay down
+    machine.JOURNAL.close()
+    machine.JOURNAL = None
+
+    count = sum(replay(path) for path in args.logs)
+    machine.compact()
+
+    print(f'Replayed {count} games')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import os
+import struct
+import zlib
+
+# File header: magic and the save count of the policy file the journal follows
+HEADER = struct.Struct('<4sI')
+MAGIC = b'MNJ2'
+
+# Each record is a count of entries and their checksum followed by (index into the table, change) entries.
+# Journals of the first layout, only written for the 3 x 3 board, have 32 bit indices
+RECORD = struct.Struct('<II')
+ENTRY = struct.Struct('<Qi')
+ENTRIES = {b'MNCJ': struct.Struct('<Ii'), MAGIC: ENTRY}
+
+
+def replay(path, base):
+    """Reads the intact records of a journal, stopping at the first torn or corrupt record
+
+    :param path: Path of the journal
+    :type path: str
+    :param base: Save count of the loaded policy file
+    :type base: int
+    :return: Changes of each record and the length of the intact part of the file, or None in place of
+        the length if the journal is missing, follows another policy file or is of an older layout
+    :rtype: tuple
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return [], None
+
+    if len(data) < HEADER.size:
+        return [], None
+
+    magic, follows = HEADER.unpack_from(data)
+    if magic not in ENTRIES or follows != base:
+        return [], None
+
+    entry = ENTRIES[magic]
+
+    records = []
+    offset = HEADER.size
+    while offset + RECORD.size <= len(data):
+        count, checksum = RECORD.unpack_from(data, offset)
+        start = offset + RECORD.size
+        end = start + count * entry.size
+        if end > len(data) or zlib.crc32(data[start:end]) != checksum:
+            break
+
+        records.append(list(entry.iter_unpack(data[start:end])))
+        offset = end
+
+    return records, offset if magic == MAGIC else None
+
+
+class Journal:
+    """Append-only log of the changes made to the game state table since the policy file was last written
+
+    :param path: Path of the journal
+    :type path: str
+    :param base: Save count of the policy file the journal follows
+    :type base: int
+    :param length: Length of the intact part of an existing journal, or None to start a new journal
+    :type length: int
+    """
+
+    def __init__(self, path, base, length=None):
+        self.path = path
+        self.base = base
+        self.pending = []
+
+        if length is None:
+            temp = path + '.tmp'
+            with open(temp, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, base))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, path)
+            length = HEADER.size
+
+        # Drop any torn record left at the end by a crash
+        self.file = open(path, 'r+b')
+        self.file.truncate(length)
+        self.file.seek(length)
+
+    def add(self, deltas):
+        """Queues a record of changes to be written on the next flush
+
+        :param deltas: Changes as (index into the table, change) pairs
+        :type deltas: list of tuple
+        """
+        entries = b''.join(ENTRY.pack(i, delta) for i, delta in deltas)
+        self.pending.append(RECORD.pack(len(deltas), zlib.crc32(entries)) + entries)
+
+    def flush(self):
+        """Appends the queued records to the file and waits for them to reach the disk
+        """
+        records, self.pending = self.pending, []
+        self.write(records)
+
+    def write(self, records):
+        """Appends records taken from the queue to the file and waits for them to reach the disk
+
+        Records can keep being queued while this runs on another thread.
+
+        :param records: Records taken from pending
+        :type records: list of bytes
+        """
+        if records:
+            self.file.write(b''.join(records))
+
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def size(self):
+        """Size of the journal including queued records
+
+        :return: Size in bytes
+        :rtype: int
+        """
+        return self.file.tell() + sum(map(len, self.pending))
+
+    def close(self):
+        self.file.close()
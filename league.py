@@ -0,0 +1,324 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+import logic
+import machine
+import policy
+import stats
+import train
+
+# Elo rating every agent starts on and the most a rating moves after one match
+START_RATING = 1500.0
+ELO_K = 32.0
+
+RATINGS_FILE = 'ratings.json'
+
+
+class Agent:
+    """Player of the league learning into a game state table of its own
+
+    :param name: Name of the agent
+    :type name: str
+    :param store: Game state table, fresh beads if not given
+    :type store: policy.PolicyStore or policy.SparseStore
+    """
+
+    def __init__(self, name, store=None):
+        self.name = name
+        self.store = machine.fresh_store() if store is None else store
+        self.rating = START_RATING
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def summary(self):
+        return {'name': self.name, 'rating': round(self.rating, 1), 'games': self.games,
+                'wins': self.wins, 'draws': self.draws, 'losses': self.losses}
+
+
+def expected(rating, other):
+    """Expected score of a player against another under the Elo model
+
+    :param rating: Rating of the player
+    :type rating: float
+    :param other: Rating of the opponent
+    :type other: float
+    :return: Expected score per game between 0 and 1
+    :rtype: float
+    """
+    return 1 / (1 + 10 ** ((other - rating) / 400))
+
+
+def round_robin(agents, rng):
+    """Pairs every agent with every other agent on both sides
+
+    :param agents: Agents of the league
+    :type agents: list of Agent
+    :param rng: Random number generator, unused
+    :type rng: random.Random
+    :return: (crosses, naughts) pairs
+    :rtype: list of tuple
+    """
+    return [(a, b) for a in agents for b in agents if a is not b]
+
+
+def elo_matched(agents, rng):
+    """Pairs every agent with one of the agents rated next to it, on a random side
+
+    :param agents: Agents of the league
+    :type agents: list of Agent
+    :param rng: Random number generator for the opponents and sides
+    :type rng: random.Random
+    :return: (crosses, naughts) pairs
+    :rtype: list of tuple
+    """
+    ranked = sorted(agents, key=lambda agent: agent.rating)
+    pairs = []
+    for i, agent in enumerate(ranked):
+        opponent = ranked[rng.choice([j for j in (i - 1, i + 1) if 0 <= j < len(ranked)])]
+        pairs.append((agent, opponent) if rng.random() < 0.5 else (opponent, agent))
+
+    return pairs
+
+
+SCHEDULES = {'round-robin': round_robin, 'elo': elo_matched}
+
+
+def play_match(crosses, naughts, games, seed=None):
+    """Plays a match between snapshots of two agents' tables in a worker process
+
+    :param crosses: Copy of the crosses table made by train.freeze
+    :type crosses: bytes or policy.SparseStore
+    :param naughts: Copy of the naughts table made by train.freeze
+    :type naughts: bytes or policy.SparseStore
+    :param games: Number of games to play
+    :type games: int
+    :param seed: Seed for the random moves, or None to seed from the operating system
+    :type seed: int
+    :return: Changes to each table and the crosses wins, draws and naughts wins
+    :rtype: tuple
+    """
+    random.seed(seed)
+    machine.JOURNAL = None
+
+    crosses_store, crosses_before = train.thaw(crosses)
+    naughts_store, naughts_before = train.thaw(naughts)
+    players = machine.Machine(crosses_store), machine.Machine(naughts_store)
+
+    results = [0, 0, 0]
+    for _ in range(games):
+        winner = train.play(*players)
+        if winner == logic.Win.CROSS_WIN:
+            results[0] += 1
+        elif winner == logic.Win.DRAW:
+            results[1] += 1
+        else:
+            results[2] += 1
+
+    return train.changes(crosses_store, crosses_before), train.changes(naughts_store, naughts_before), results
+
+
+def score(crosses, naughts, results):
+    """Adds the results of a match to both agents and moves their ratings
+
+    :param crosses: Agent playing crosses
+    :type crosses: Agent
+    :param naughts: Agent playing naughts
+    :type naughts: Agent
+    :param results: Crosses wins, draws and naughts wins
+    :type results: list of int
+    """
+    wins, draws, losses = results
+    games = wins + draws + losses
+
+    change = ELO_K * ((wins + draws / 2) / games - expected(crosses.rating, naughts.rating))
+    crosses.rating += change
+    naughts.rating -= change
+
+    crosses.wins += wins
+    crosses.draws += draws
+    crosses.losses += losses
+    naughts.wins += losses
+    naughts.draws += draws
+    naughts.losses += wins
+
+
+def checkpoint(agents, directory, keep):
+    """Writes the ratings of every agent and the tables of the best rated agents
+
+    :param agents: Agents of the league
+    :type agents: list of Agent
+    :param directory: Directory to write to
+    :type directory: str
+    :param keep: Number of the best rated agents to keep the tables of
+    :type keep: int
+    """
+    os.makedirs(directory, exist_ok=True)
+    ranked = sorted(agents, key=lambda agent: agent.rating, reverse=True)
+
+    for agent in ranked[:keep]:
+        path = os.path.join(directory, agent.name + '.policy')
+        with open(path + '.tmp', 'wb') as f:
+            agent.store.save(f, agent.games)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    path = os.path.join(directory, RATINGS_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump([agent.summary() for agent in ranked], f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def load_league(directory, count):
+    """Restores the agents of a checkpoint, filling up the league with fresh agents
+
+    Agents whose tables were not kept start again from fresh beads, keeping their rating.
+
+    :param directory: Directory of the checkpoint
+    :type directory: str
+    :param count: Number of agents in the league
+    :type count: int
+    :return: Agents
+    :rtype: list of Agent
+    """
+    agents = []
+    try:
+        with open(os.path.join(directory, RATINGS_FILE)) as f:
+            summaries = json.load(f)
+    except FileNotFoundError:
+        summaries = []
+
+    for summary in summaries[:count]:
+        try:
+            with open(os.path.join(directory, summary['name'] + '.policy'), 'rb') as f:
+                store, _ = policy.load(f)
+        except FileNotFoundError:
+            store = None
+
+        agent = Agent(summary['name'], store)
+        agent.rating = summary['rating']
+        agent.wins, agent.draws, agent.losses = summary['wins'], summary['draws'], summary['losses']
+        agents.append(agent)
+
+    names = {agent.name for agent in agents}
+    i = 0
+    while len(agents) < count:
+        if f'agent{i}' not in names:
+            agents.append(Agent(f'agent{i}'))
+        i += 1
+
+    return agents
+
+
+def run(agents, rounds=None, seconds=None, games=200, workers=1, schedule='round-robin', seed=None,
+        directory='league', keep=3, checkpoint_every=10):
+    """Plays rounds of matches between the agents over a pool of worker processes
+
+    Each round every pair of the schedule plays a match against snapshots of both tables and the
+    changes are merged into each agent's own table before the next round.
+
+    :param agents: Agents of the league
+    :type agents: list of Agent
+    :param rounds: Number of rounds to play
+    :type rounds: int
+    :param seconds: Time budget in seconds
+    :type seconds: float
+    :param games: Games in each match
+    :type games: int
+    :param workers: Number of worker processes
+    :type workers: int
+    :param schedule: Name of the schedule pairing agents each round, a key of SCHEDULES
+    :type schedule: str
+    :param seed: Base seed for the pairings and every match
+    :type seed: int
+    :param directory: Directory to checkpoint to
+    :type directory: str
+    :param keep: Number of the best rated agents to checkpoint the tables of
+    :type keep: int
+    :param checkpoint_every: Rounds between checkpoints
+    :type checkpoint_every: int
+    :return: Number of games played and seconds taken
+    :rtype: tuple
+    """
+    rng = random.Random(seed)
+    pairing = SCHEDULES[schedule]
+
+    start = time.perf_counter()
+    deadline = start + seconds if seconds else None
+
+    count = 0
+    played = 0
+    with multiprocessing.Pool(workers) as pool:
+        while (rounds is None or played < rounds) and (deadline is None or time.perf_counter() < deadline):
+            pairs = pairing(agents, rng)
+            snapshots = {agent.name: train.freeze(agent.store) for pair in pairs for agent in pair}
+            jobs = [(snapshots[a.name], snapshots[b.name], games, None if seed is None else seed + count + i)
+                    for i, (a, b) in enumerate(pairs)]
+
+            for (a, b), (crosses, naughts, results) in zip(pairs, pool.starmap(play_match, jobs)):
+                machine.merge(crosses, a.store)
+                machine.merge(naughts, b.store)
+                score(a, b, results)
+
+            played += 1
+            count += games * len(pairs)
+
+            if checkpoint_every and played % checkpoint_every == 0:
+                checkpoint(agents, directory, keep)
+
+    checkpoint(agents, directory, keep)
+
+    return count, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train a league of machines with tables of their own')
+    parser.add_argument('-a', '--agents', type=int, default=6, help='number of agents in the league')
+    parser.add_argument('-r', '--rounds', type=int, help='number of rounds to play')
+    parser.add_argument('-t', '--seconds', type=float, help='time budget in seconds')
+    parser.add_argument('-g', '--games', type=int, default=200, help='games in each match')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--schedule', choices=sorted(SCHEDULES), default='round-robin',
+                        help='how agents are paired each round')
+    parser.add_argument('--seed', type=int, help='base seed for the pairings and matches')
+    parser.add_argument('-d', '--directory', default='league', help='directory to checkpoint the league to')
+    parser.add_argument('-k', '--keep', type=int, default=3, help='number of best agents to keep the tables of')
+    parser.add_argument('-c', '--checkpoint-every', type=int, default=10, help='rounds between checkpoints')
+    parser.add_argument('--promote', action='store_true',
+                        help="replace the machine's policy with the table of the best agent when done")
+    parser.add_argument('--size', type=int, default=3, help='number of blocks along each side of the board')
+    parser.add_argument('--win-length', type=int, default=3, help='number of blocks in a row needed to win')
+    args = parser.parse_args()
+
+    if args.rounds is None and args.seconds is None:
+        parser.error('one of --rounds or --seconds is required')
+    if args.agents < 2:
+        parser.error('a league needs at least 2 agents')
+
+    machine.configure(args.size, args.win_length)
+    stats.setup()
+
+    agents = load_league(args.directory, args.agents)
+    count, elapsed = run(agents, args.rounds, args.seconds, args.games, args.workers, args.schedule, args.seed,
+                         args.directory, args.keep, args.checkpoint_every)
+
+    print(f'Played {count} games in {elapsed:.2f}s ({count / elapsed:.0f} games/s)')
+    for agent in sorted(agents, key=lambda agent: agent.rating, reverse=True):
+        print(f'{agent.name:>10} {agent.rating:7.1f} {agent.wins:>8} {agent.draws:>8} {agent.losses:>8}')
+
+    if args.promote:
+        machine.load_policy()
+        machine.GAMESTATES = max(agents, key=lambda agent: agent.rating).store
+        machine.compact()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
 from enum import IntEnum
 from enum import Enum
+import itertools
 import machine
+import policy
 
 # Constants
 NAUGHT_COLOUR = (242, 235, 211)
@@ -13,17 +15,18 @@ class Human:
         self.name = 'Bob'
         self.score = 0
 
-    def think(self, block):
-        """Changes the state of a block
+    def think(self, game, index):
+        """Plays a block for the side to move
 
-        :param block: The block to change
-        :type block: Block
+        :param game: Game to play in
+        :type game: Game
+        :param index: Index of the block to play
+        :type index: int
         :return: True if valid move and False if invalid move
         :rtype: bool
         """
-        if block.state == State.EMPTY:
-            block.set_state(TURN.value)
-            TURN.switch()
+        if game.legal(index):
+            game.play(index)
             return True
 
         print(f'{self.name}, that is an invalid location!')
@@ -42,10 +45,26 @@ class Human:
 class Player(Enum):
     HUMAN = Human()
     COMPUTER = machine.Machine()
+    SOLVER = 'solver'  # Made by get_player, since the solver imports this module
+
+    def get_player(self):
+        """Getter for the player of each option
+
+        :return: Player
+        :rtype: Human or machine.Machine or solver.Solver
+        """
+        if self == Player.SOLVER:
+            import solver
+            return solver.Solver()
+
+        return self.value
 
     def switch(self):
         if self == Player.HUMAN:
             return Player.COMPUTER
+        # The solver only plays the 3 x 3 board with 3 in a row
+        elif self == Player.COMPUTER and (SIZE, WIN_LENGTH) == (3, 3):
+            return Player.SOLVER
         return Player.HUMAN
 
     def get_offset(self):
@@ -153,24 +172,125 @@ class Win(Enum):
         return 0
 
 
-class Turn(Enum):
-    """Enum representing whose turn it is
+def lines(size, length):
+    """Generates the blocks of every row, column and diagonal run long enough to win
+
+    :param size: Number of blocks along each side of the board
+    :type size: int
+    :param length: Number of blocks in a row needed to win
+    :type length: int
+    :return: Indices of the blocks of each run
+    :rtype: generator of tuple of int
     """
-    NAUGHT = State.NAUGHT
-    CROSS = State.CROSS
+    for r in range(size):
+        for c in range(size):
+            for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                if 0 <= r + dr * (length - 1) < size and 0 <= c + dc * (length - 1) < size:
+                    yield tuple((r + dr * i) * size + c + dc * i for i in range(length))
 
-    def switch(self):
-        """Switches whose turn it is
-        """
-        global TURN
 
-        if self == Turn.NAUGHT:
-            TURN = Turn.CROSS
-        elif self == Turn.CROSS:
-            TURN = Turn.NAUGHT
+def configure(size=3, win_length=3):
+    """Sets the size of the board and the number of blocks in a row needed to win
 
-    def __eq__(self, other):
-        return self.name == other.name
+    :param size: Number of blocks along each side of the board
+    :type size: int
+    :param win_length: Number of blocks in a row needed to win
+    :type win_length: int
+    """
+    global SIZE, WIN_LENGTH, CELLS, LINES, CELL_LINES, WIN_MASKS, FULL_MASK, WINNING
+
+    if not 1 <= win_length <= size:
+        raise ValueError('The win length must fit on the board')
+
+    SIZE = size
+    WIN_LENGTH = win_length
+    CELLS = size * size
+
+    # Blocks and bit masks of each line and the mask of a full board
+    LINES = tuple(lines(size, win_length))
+    CELL_LINES = tuple(tuple(j for j, line in enumerate(LINES) if i in line) for i in range(CELLS))
+    WIN_MASKS = tuple(sum(1 << i for i in line) for line in LINES)
+    FULL_MASK = (1 << CELLS) - 1
+
+    # Whether each possible bitboard contains a line, if the board is small enough to list every bitboard
+    if CELLS <= MAX_WINNING_CELLS:
+        WINNING = bytes(has_line(board) for board in range(FULL_MASK + 1))
+    else:
+        WINNING = None
+
+
+def has_line(board):
+    """Checks whether a bitboard contains a line
+
+    :param board: Bitboard of one side
+    :type board: int
+    :return: True if every block of a line is taken
+    :rtype: bool
+    """
+    for mask in WIN_MASKS:
+        if board & mask == mask:
+            return True
+
+    return False
+
+
+def to_bitboard(cells):
+    """Converts the values of each block into bitboards with one bit per block
+
+    :param cells: Values of each block
+    :type cells: iterable of State or int
+    :return: Bitboards of the crosses and the naughts
+    :rtype: tuple of int
+    """
+    # Comparing with plain ints skips looking up the enum members for every block
+    crosses = naughts = 0
+    bit = 1
+    for x in cells:
+        if x == 1:
+            crosses |= bit
+        elif x == -1:
+            naughts |= bit
+        bit <<= 1
+
+    return crosses, naughts
+
+
+def from_bitboard(crosses, naughts):
+    """Converts bitboards back into the values of each block
+
+    :param crosses: Bitboard of the crosses
+    :type crosses: int
+    :param naughts: Bitboard of the naughts
+    :type naughts: int
+    :return: Values of each block
+    :rtype: tuple of int
+    """
+    return tuple((crosses >> i & 1) - (naughts >> i & 1) for i in range(CELLS))
+
+
+def check_bitboard(crosses, naughts):
+    """Checks the game state of a pair of bitboards
+
+    :param crosses: Bitboard of the crosses
+    :type crosses: int
+    :param naughts: Bitboard of the naughts
+    :type naughts: int
+    :return: Returns game states: naughts win, crosses win, draw and not ended
+    :rtype: Win
+    """
+    if WINNING is None:
+        crosses_win, naughts_win = has_line(crosses), has_line(naughts)
+    else:
+        crosses_win, naughts_win = WINNING[crosses], WINNING[naughts]
+
+    if crosses_win:
+        return Win.CROSS_WIN
+    elif naughts_win:
+        return Win.NAUGHT_WIN
+    elif crosses | naughts == FULL_MASK:
+        return Win.DRAW
+
+    return Win.NOT_END
 
 
 def check_end(array):
@@ -181,38 +301,133 @@ def check_end(array):
     :return: Returns game states: naughts win, crosses win, draw and not ended
     :rtype: Win
     """
-    columns = [[], [], []]
-
-    for row in array:
-        total = sum(row)
-        if total == 3:
-            return Win.CROSS_WIN
-        elif total == -3:
-            return Win.NAUGHT_WIN
-        for i, x in enumerate(row):
-            try:
-                columns[i].append(x)
-            except IndexError as e:
-                print('Error')
-
-    for row in columns:
-        total = sum(row)
-        if total == 3:
-            return Win.CROSS_WIN
-        elif total == -3:
-            return Win.NAUGHT_WIN
-
-    if array[0][0] + array[1][1] + array[2][2] == 3 or array[0][2] + array[1][1] + array[2][0] == 3:
-        return Win.CROSS_WIN
-    elif array[0][0] + array[1][1] + array[2][2] == -3 or array[0][2] + array[1][1] + array[2][0] == -3:
-        return Win.NAUGHT_WIN
+    return check_bitboard(*to_bitboard(itertools.chain.from_iterable(array)))
+
+
+class Board:
+    """Values of each block along with a running sum of each line, so that each move
+    only needs to check the lines through its block
+    """
+
+    def __init__(self):
+        self.cell_lines = CELL_LINES
+        self.length = WIN_LENGTH
+        self.reset()
+
+    def reset(self):
+        """Empties the board
+        """
+        self.cells = [State.EMPTY] * len(self.cell_lines)
+        self.sums = [0] * len(LINES)
+        self.filled = 0
+
+    def play(self, index, value):
+        """Puts a naught or cross on a block and checks the lines through it
+
+        :param index: Index of the block
+        :type index: int
+        :param value: Naught or cross
+        :type value: State
+        :return: Returns game states: naughts win, crosses win, draw and not ended
+        :rtype: Win
+        """
+        self.cells[index] = value
+        self.filled += 1
+
+        sums = self.sums
+        won = False
+        for line in self.cell_lines[index]:
+            sums[line] += value
+            if sums[line] == value * self.length:
+                won = True
+
+        if won:
+            return Win.CROSS_WIN if value == State.CROSS else Win.NAUGHT_WIN
+        elif self.filled == len(self.cells):
+            return Win.DRAW
+
+        return Win.NOT_END
+
+    def undo(self, index):
+        """Takes the naught or cross off a block
+
+        :param index: Index of the block
+        :type index: int
+        """
+        value = self.cells[index]
+        self.cells[index] = State.EMPTY
+        self.filled -= 1
+
+        for line in self.cell_lines[index]:
+            self.sums[line] -= value
 
-    for row in array:
-        if State.EMPTY in row:
-            return Win.NOT_END
 
-    return Win.DRAW
+class Game:
+    """One game holding its own board, side to move, moves played and result, so any number of games
+    can run at once
+    """
+
+    def __init__(self):
+        self.board = Board()
+        self.reset()
+
+    def reset(self):
+        """Starts the game again from an empty board
+        """
+        self.board.reset()
+        self.turn = State.CROSS
+        self.code = 0  # State code of the board, kept up to date with each move
+        self.history = []
+        self.result = Win.NOT_END
+
+    @property
+    def cells(self):
+        return self.board.cells
+
+    def legal(self, index):
+        """Checks if a block can be played
+
+        :param index: Index of the block
+        :type index: int
+        :return: True if the game has not ended and the block is on the board and empty
+        :rtype: bool
+        """
+        return (self.result == Win.NOT_END and 0 <= index < len(self.board.cells)
+                and self.board.cells[index] == State.EMPTY)
+
+    def play(self, index):
+        """Plays a block for the side to move and passes the turn
+
+        :param index: Index of the block
+        :type index: int
+        :return: Returns game states: naughts win, crosses win, draw and not ended
+        :rtype: Win
+        """
+        if not self.legal(index):
+            raise ValueError(f'Block {index} cannot be played')
+
+        self.code += policy.DIGITS[self.turn] * policy.POWERS[index]
+        self.history.append(index)
+        self.result = self.board.play(index, self.turn)
+        self.turn = State(-self.turn)
+
+        return self.result
+
+    def undo(self):
+        """Takes back the last move
+
+        :return: Index of the block taken back
+        :rtype: int
+        """
+        index = self.history.pop()
+        self.turn = State(-self.turn)
+        self.board.undo(index)
+        self.code -= policy.DIGITS[self.turn] * policy.POWERS[index]
+        self.result = Win.NOT_END
+
+        return index
 
 
-# Holds whose turn it is
-TURN = Turn.CROSS
+# Largest board to build a table of winning bitboards for
+MAX_WINNING_CELLS = 16
+configure()
@@ -1,111 +1,540 @@
-import itertools
+import io
+import os
 import pickle
 import logic
 import random
+import journal
+import policy
+import symmetry
 
 # TODO: combine game state dictionaries
-# Game state dictionary
-GAMESTATES = {}
+# Game state table holding the number of beads on each block for each canonical state code
+GAMESTATES = policy.PolicyStore()
 SAVECOUNT = 0
 
+POLICY_FILE = 'GAMESTATES.policy'
+# Changes since the policy file was written, compacted into it once the journal grows past COMPACT_SIZE bytes
+JOURNAL_FILE = 'GAMESTATES.journal'
+JOURNAL = None
+COMPACT_SIZE = 1 << 23
+# Functions called with every change made to the game state table, such as metrics.Monitor.watch
+WATCHERS = []
+# Bytes of memory to hold the states of larger boards in, keeping the rest in TIER_FILE, or None to hold them all
+MEMORY = None
+TIER_FILE = 'GAMESTATES.db'
+# Pickle file of older versions (unversioned pickles hold lists of bead indices
+# and versioned pickles hold bead counts)
+PICKLE_FILE = 'GAMESTATES.pickle'
+MOVES = range(9)
 
-def update_pickle():
-    """Updates the pickle file with the game state dictionaries
+
+def configure(size=3, win_length=3, memory=None):
+    """Sets the size of the board and the number of blocks in a row needed to win
+
+    The 3 x 3 board keeps every state in a flat table. Larger boards keep a sparse table of the states
+    visited so far in their own policy file, holding only the most recently used states in memory if
+    given a memory budget.
+
+    :param size: Number of blocks along each side of the board
+    :type size: int
+    :param win_length: Number of blocks in a row needed to win
+    :type win_length: int
+    :param memory: Bytes of memory to hold the states of larger boards in, or None to hold them all
+    :type memory: int
     """
-    global GAMESTATES
+    global GAMESTATES, POLICY_FILE, JOURNAL_FILE, TIER_FILE, JOURNAL, MOVES, MEMORY
+
+    logic.configure(size, win_length)
+    policy.configure(logic.CELLS)
+    symmetry.configure(size)
+    MOVES = range(logic.CELLS)
+
+    name = 'GAMESTATES' if (size, win_length) == (3, 3) else f'GAMESTATES-{size}x{size}-{win_length}'
+    POLICY_FILE = name + '.policy'
+    JOURNAL_FILE = name + '.journal'
+    TIER_FILE = name + '.db'
+    MEMORY = memory
+
+    if JOURNAL is not None:
+        JOURNAL.close()
+        JOURNAL = None
+
+    GAMESTATES = new_store()
+
+
+def new_store():
+    """Makes an empty game state table for the size of the board
+
+    Only one tiered table can use the database file at a time, so making one closes the table it replaces.
+
+    :return: Game state table
+    :rtype: policy.PolicyStore or policy.SparseStore or policy.TieredStore
+    """
+    if logic.CELLS == policy.MOVES:
+        return policy.PolicyStore()
+
+    if MEMORY is not None:
+        close_store()
+        store = policy.TieredStore(logic.CELLS, TIER_FILE, MEMORY)
+        symmetry.limit_cache(store.limit)
+        return store
+
+    return policy.SparseStore(logic.CELLS)
 
-    for c in itertools.product((0, -1, 1), repeat=9):
-        if c.count(0) == 0:
-            continue
 
-        diff = c.count(1) - c.count(-1)
-        indices = [i for i, x in enumerate(c) if x == 0] * 2
-        if diff == 0 or diff == 1:
-            GAMESTATES[c] = indices
+def close_store():
+    """Closes the database file of the game state table if it is a tiered table
+    """
+    if isinstance(GAMESTATES, policy.TieredStore):
+        GAMESTATES.close()
+
+
+def fresh_store():
+    """Makes a game state table with fresh beads for every state, or with no states for boards
+    whose states are only added once visited
+
+    :return: Game state table
+    :rtype: policy.PolicyStore or policy.SparseStore
+    """
+    store = new_store()
+
+    if isinstance(store, policy.PolicyStore):
+        for code in reachable_states():
+            store[code] = empty_beads(policy.decode(code), 2)
 
-    with open('GAMESTATES.pickle', 'wb') as f:
-        pickle.dump((GAMESTATES, SAVECOUNT), f, protocol=pickle.HIGHEST_PROTOCOL)
+    return store
+
+
+def update_policy():
+    """Updates the policy file with fresh beads for every state, or with no states for boards
+    whose states are only added once visited
+    """
+    global GAMESTATES
+
+    GAMESTATES = fresh_store()
+    compact()
 
     print('UPDATED')
 
 
-def load_pickle():
-    """Loads the game state dictionary from the pickle file
+def reachable_states():
+    """Generates every canonical state code that can occur in a game and has not ended,
+    searching forward from the empty board
+
+    :return: Canonical state codes
+    :rtype: generator of int
     """
-    global GAMESTATES, SAVECOUNT
+    seen = {0}
+    stack = [0]
+    while stack:
+        code = stack.pop()
+        yield code
+
+        state = policy.decode(code)
+        crosses, naughts = logic.to_bitboard(state)
+        cross = state.count(1) == state.count(-1)
+        digit = policy.DIGITS[logic.State.CROSS if cross else logic.State.NAUGHT]
+        for i, x in enumerate(state):
+            if x != 0:
+                continue
+
+            child = code + digit * policy.POWERS[i]
+            if cross:
+                result = logic.check_bitboard(crosses | 1 << i, naughts)
+            else:
+                result = logic.check_bitboard(crosses, naughts | 1 << i)
+            if result != logic.Win.NOT_END:
+                continue
 
-    with open('GAMESTATES.pickle', 'rb') as f:
-        GAMESTATES, SAVECOUNT = pickle.load(f)
+            canon = symmetry.canonical(child)[0]
+            if canon not in seen:
+                seen.add(canon)
+                stack.append(canon)
 
 
-def save_pickle():
-    """Saves the game state dictionary into a pickle file
+def load_policy():
+    """Loads the game state table from the policy file and replays the journal on top of it,
+    migrating the pickle file if there is no policy file
+    """
+    global GAMESTATES, SAVECOUNT, JOURNAL
+
+    if JOURNAL is not None:
+        JOURNAL.close()
+        JOURNAL = None
+
+    if not os.path.exists(POLICY_FILE):
+        if (logic.SIZE, logic.WIN_LENGTH) == (3, 3) and os.path.exists(PICKLE_FILE):
+            GAMESTATES, SAVECOUNT = load_pickle()
+            compact()
+            return
+        elif (logic.SIZE, logic.WIN_LENGTH) != (3, 3):
+            # The pickle only holds the classic game, so other games start from fresh beads,
+            # with the states of larger boards added as they are visited
+            GAMESTATES = fresh_store()
+            compact()
+            return
+
+    with open(POLICY_FILE, 'rb') as f:
+        if MEMORY is not None and logic.CELLS != policy.MOVES:
+            close_store()
+            GAMESTATES, SAVECOUNT = policy.TieredStore.load(f, TIER_FILE, MEMORY)
+            symmetry.limit_cache(GAMESTATES.limit)
+        else:
+            GAMESTATES, SAVECOUNT = policy.load(f)
+
+    records, length = journal.replay(JOURNAL_FILE, SAVECOUNT)
+    for deltas in records:
+        for i, delta in deltas:
+            GAMESTATES.add(i, delta)
+
+    if records and length is None:
+        # Journals of an older layout are compacted rather than appended to
+        compact()
+    else:
+        JOURNAL = journal.Journal(JOURNAL_FILE, SAVECOUNT, length)
+
+
+def map_policy():
+    """Maps the policy file in place of loading it, for playing without learning
+
+    The table is used straight from the file, so startup does not depend on its size and every process
+    mapping it shares one copy. The map is a private copy on write view, so the changes in the journal are
+    replayed into it and only the pages they touch are copied. Nothing is ever written to the files, which
+    stay owned by the process journaling to them, and changes journaled after mapping are not seen.
+    """
+    global GAMESTATES, SAVECOUNT, JOURNAL
+
+    if logic.CELLS != policy.MOVES:
+        raise ValueError('Only the table of the 3 x 3 board can be mapped')
+
+    if JOURNAL is not None:
+        JOURNAL.close()
+        JOURNAL = None
+
+    GAMESTATES, SAVECOUNT = policy.PolicyStore.open(POLICY_FILE, writable=True)
+
+    records, _ = journal.replay(JOURNAL_FILE, SAVECOUNT)
+    for deltas in records:
+        for i, delta in deltas:
+            GAMESTATES.add(i, delta)
+
+
+def save_policy():
+    """Saves the changes to the game state table into the journal, compacting it into the policy file once it is large
+    """
+    if JOURNAL is not None and JOURNAL.size() < COMPACT_SIZE:
+        JOURNAL.flush()
+    else:
+        compact()
+
+
+def snapshot():
+    """Takes what save_policy would write, so that it can be written while the game state table keeps changing
+
+    Changes made after the snapshot are queued in the journal as usual. Once the returned function has
+    run, on any thread, what it returns is passed to resume.
+
+    :return: Function writing the snapshot to disk and returning the journal to continue with
+    :rtype: callable
     """
     global SAVECOUNT
 
+    current = JOURNAL
+    if current is not None and current.size() < COMPACT_SIZE:
+        records, current.pending = current.pending, []
+
+        def append():
+            current.write(records)
+            return current
+
+        return append
+
+    # Changes queued so far are part of the table, so only those made from now on go into the new journal
+    SAVECOUNT += 1
+    savecount = SAVECOUNT
+    print(f'Saved: {savecount}')
+
+    data = io.BytesIO()
+    GAMESTATES.save(data, savecount)
+    if current is not None:
+        current.pending = []
+
+    def replace():
+        temp = POLICY_FILE + '.tmp'
+        with open(temp, 'wb') as f:
+            f.write(data.getbuffer())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, POLICY_FILE)
+
+        return journal.Journal(JOURNAL_FILE, savecount)
+
+    return replace
+
+
+def resume(written):
+    """Continues with the journal returned once a snapshot has been written, keeping the changes queued since
+
+    :param written: Journal returned by the function from snapshot
+    :type written: journal.Journal
+    """
+    global JOURNAL
+
+    if written is JOURNAL:
+        return
+
+    if JOURNAL is not None:
+        written.pending.extend(JOURNAL.pending)
+        JOURNAL.close()
+    JOURNAL = written
+
+
+def compact():
+    """Writes the whole game state table into the policy file and starts an empty journal
+
+    The policy file is replaced atomically, so a crash part way through leaves the previous policy file
+    and journal intact. A journal left behind by a crash after the replace is ignored since it follows
+    an older save count.
+    """
+    global SAVECOUNT, JOURNAL
+
     SAVECOUNT += 1
     print(f'Saved: {SAVECOUNT}')
 
-    with open('GAMESTATES.pickle', 'wb') as f:
-        pickle.dump((GAMESTATES, SAVECOUNT), f, protocol=pickle.HIGHEST_PROTOCOL)
+    temp = POLICY_FILE + '.tmp'
+    with open(temp, 'wb') as f:
+        GAMESTATES.save(f, SAVECOUNT)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, POLICY_FILE)
+
+    if JOURNAL is not None:
+        JOURNAL.close()
+    JOURNAL = journal.Journal(JOURNAL_FILE, SAVECOUNT)
+
+
+def record(deltas):
+    """Queues changes to the game state table in the journal if one is open and passes them to the watchers
+
+    :param deltas: Changes as (index into the table, change) pairs
+    :type deltas: list of tuple
+    """
+    if JOURNAL is not None and deltas:
+        JOURNAL.add(deltas)
+
+    for watch in WATCHERS:
+        watch(deltas)
+
+
+def load_pickle():
+    """Loads a game state dictionary of an older version from the pickle file
+
+    :return: Game state table and save count
+    :rtype: tuple
+    """
+    with open(PICKLE_FILE, 'rb') as f:
+        data = pickle.load(f)
+
+    gamestates, savecount = data[:2]
+    if len(data) == 2:
+        gamestates = migrate(gamestates)
+
+    return fold(gamestates), savecount
+
+
+def migrate(gamestates):
+    """Converts a game state dictionary holding lists of bead indices into bead counts
+
+    :param gamestates: Game state dictionary of the old layout
+    :type gamestates: dict
+    :return: Game state dictionary of bead counts
+    :rtype: dict
+    """
+    migrated = {}
+    for state, beads in gamestates.items():
+        counts = [0] * 9
+        for i in beads:
+            counts[i] += 1
+        migrated[state] = counts
+
+    return migrated
 
 
-def prepare_data(arr):
-    """Convert blocks to numbers
+def fold(gamestates):
+    """Merges the bead counts of symmetric states into the rows of their canonical state codes
 
-    :param arr: Array to convert
-    :type arr: list of game.Block
-    :return: Values of blocks in array
-    :rtype: tuple of int
+    :param gamestates: Game state dictionary of bead counts keyed by any state
+    :type gamestates: dict
+    :return: Game state table
+    :rtype: policy.PolicyStore
     """
-    return tuple(map(lambda x: x.state.value, arr))
+    folded = policy.PolicyStore()
+    for state, counts in gamestates.items():
+        canon, k = symmetry.canonical(policy.encode(state))
+        merged = folded[canon]
+        for j, i in enumerate(symmetry.SYMMETRIES[k]):
+            merged[j] += counts[i]
+
+    return folded
+
+
+def merge(deltas, store=None):
+    """Adds changes to the bead counts made elsewhere into a game state table
+
+    Bead counts that would go negative are clamped and states left without beads are refilled.
+
+    :param deltas: Changes as (index into the table, change) pairs
+    :type deltas: list of tuple
+    :param store: Game state table to change, or None for GAMESTATES, whose changes are also journaled
+    :type store: policy.PolicyStore or policy.SparseStore
+    """
+    gamestates = GAMESTATES if store is None else store
+    cells = logic.CELLS
+    before = {}
+    for i, delta in deltas:
+        code, move = divmod(i, cells)
+        counts = gamestates[code]
+        if code not in before:
+            before[code] = counts.tolist()
+        counts[move] = max(counts[move] + delta, 0)
+
+    for code in before:
+        if not any(gamestates[code]):
+            gamestates[code] = empty_beads(policy.decode(code))
+
+    if store is None:
+        record([(code * cells + i, new - old)
+                for code, counts in before.items()
+                for i, (new, old) in enumerate(zip(GAMESTATES[code], counts)) if new != old])
+
+
+def empty_beads(state, beads=1):
+    """Bead counts with the same number of beads on every empty block
+
+    :param state: Values of each block
+    :type state: tuple of int
+    :param beads: Beads to put on each empty block
+    :type beads: int
+    :return: Bead counts
+    :rtype: list of int
+    """
+    return [beads if x == 0 else 0 for x in state]
 
 
 class Machine:
-    def __init__(self):
-        self.played = {}
+    """Player picking moves by drawing beads from a game state table
+
+    :param store: Game state table of its own, or None to share GAMESTATES
+    :type store: policy.PolicyStore or policy.SparseStore
+    """
 
-    def think(self, blocks):
-        """Change the state of the block using game state dictionary
+    def __init__(self, store=None):
+        self.store = store
+        self.played = {}  # Canonical state codes played this game and the canonical moves chosen
 
-        :param blocks: Blocks to change
-        :type blocks: list of game.Block
+    def table(self):
+        """Getter for the game state table the machine plays from and learns into
+
+        :return: Game state table
+        :rtype: policy.PolicyStore or policy.SparseStore
+        """
+        return GAMESTATES if self.store is None else self.store
+
+    def record(self, deltas):
+        """Journals changes made to the shared table, leaving tables of its own to their owner to save
+
+        :param deltas: Changes as (index into the table, change) pairs
+        :type deltas: list of tuple
+        """
+        if self.store is None:
+            record(deltas)
+
+    def choose(self, code):
+        """Pick a move for a game state using game state table
+
+        :param code: State code of the blocks
+        :type code: int
+        :return: Index of the chosen block
+        :rtype: int
         """
-        state = prepare_data(blocks)
-        choice = random.choice(GAMESTATES[state])
+        canon, k = symmetry.canonical(code)
+        choice = random.choices(MOVES, self.table()[canon])[0]
+        self.played[canon] = choice
 
-        blocks[choice].set_state(logic.TURN.value)
-        logic.TURN.switch()
+        return symmetry.from_canonical(choice, k)
+
+    def choose_many(self, boards, temperature=1.0, greedy=False, rng=None):
+        """Pick moves for many game states at once, without recording them for learning
+
+        Needs NumPy.
+
+        :param boards: Values of each block of each board, one board per row
+        :type boards: numpy.ndarray or sequence of sequence of int
+        :param temperature: Bead counts are raised to the power of one over it before drawing
+        :type temperature: float
+        :param greedy: Whether to always pick the move with the most beads
+        :type greedy: bool
+        :param rng: Random number generator for the moves
+        :type rng: numpy.random.Generator
+        :return: Index of the chosen block of each board, -1 for boards whose game has ended or that have no beads
+        :rtype: numpy.ndarray
+        """
+        import batch
+        return batch.select(self.table(), boards, temperature, greedy, rng)
+
+    def think(self, game):
+        """Play a move using game state table
+
+        :param game: Game to play in
+        :type game: logic.Game
+        :return: Index of the played block
+        :rtype: int
+        """
+        choice = self.choose(game.code)
+        game.play(choice)
 
-        self.played[state] = choice
+        return choice
 
     def reward(self):
         """Reward the machine for a win
         """
-        for state in self.played:
-            GAMESTATES[state] = GAMESTATES[state] + [self.played[state]] * 3
+        gamestates = self.table()
+        for code, choice in self.played.items():
+            gamestates[code][choice] += 3
 
+        self.record([(code * logic.CELLS + choice, 3) for code, choice in self.played.items()])
         self.played = {}
 
     def punish(self):
         """Punish the machine for a loss
         """
-        for state in self.played:
-            GAMESTATES[state].remove(self.played[state])
-            if len(GAMESTATES[state]) == 0:
-                GAMESTATES[state] = [i for i, x in enumerate(state) if x == 0]
+        gamestates = self.table()
+        deltas = []
+        for code, choice in self.played.items():
+            counts = gamestates[code]
+            # Games played at once can take the same bead, so never go below none
+            if counts[choice] > 0:
+                counts[choice] -= 1
+                deltas.append((code * logic.CELLS + choice, -1))
+            if not any(counts):
+                counts = empty_beads(policy.decode(code))
+                gamestates[code] = counts
+                deltas.extend((code * logic.CELLS + i, 1) for i, x in enumerate(counts) if x)
 
+        self.record(deltas)
         self.played = {}
 
     def draw(self):
         """Reward the machine slightly for a draw
         """
-        for state in self.played:
-            GAMESTATES[state] = GAMESTATES[state] + [self.played[state]]
+        gamestates = self.table()
+        for code, choice in self.played.items():
+            gamestates[code][choice] += 1
 
+        self.record([(code * logic.CELLS + choice, 1) for code, choice in self.played.items()])
         self.played = {}
 
 
 if __name__ == '__main__':
-    update_pickle()
-    load_pickle()
+    update_policy()
+    load_policy()
@@ -0,0 +1,228 @@
+import json
+import math
+import sys
+import time
+import logic
+import machine
+import solver
+
+
+def entropy(counts):
+    """Entropy of the move drawn from a state's bead counts
+
+    :param counts: Bead counts of each block
+    :type counts: iterable of int
+    :return: Entropy in bits
+    :rtype: float
+    """
+    counts = [x for x in counts if x > 0]
+    total = sum(counts)
+
+    return -sum(x / total * math.log2(x / total) for x in counts)
+
+
+def evaluate(games=200, player=machine.Machine):
+    """Plays a player against the solver on both sides without learning
+
+    :param games: Number of games to play, half on each side
+    :type games: int
+    :param player: Makes the player, called for each game so nothing it played is kept
+    :type player: callable
+    :return: Share of games drawn
+    :rtype: float
+    """
+    opponent = solver.Solver()
+
+    draws = 0
+    for i in range(games):
+        game = logic.Game()
+        seats = (player(), opponent) if i % 2 == 0 else (opponent, player())
+        while game.result == logic.Win.NOT_END:
+            seats[len(game.history) % 2].think(game)
+
+        if game.result == logic.Win.DRAW:
+            draws += 1
+
+    return draws / games
+
+
+class EarlyStop:
+    """Stops training once the draw rate against the solver reaches a target or stops improving
+
+    :param games: Games against the solver of each check
+    :type games: int
+    :param target: Draw rate to stop at, or None to only stop on a plateau
+    :type target: float
+    :param patience: Checks without improvement to stop after, or None to only stop on the target
+    :type patience: int
+    :param tolerance: Smallest rise in the draw rate that counts as an improvement
+    :type tolerance: float
+    """
+
+    def __init__(self, games=200, target=None, patience=None, tolerance=0.01):
+        self.games = games
+        self.target = target
+        self.patience = patience
+        self.tolerance = tolerance
+        self.best = -1.0
+        self.stale = 0
+        self.rate = None
+
+    def check(self):
+        """Measures the draw rate against the solver
+
+        :return: True if training should stop
+        :rtype: bool
+        """
+        self.rate = evaluate(self.games)
+
+        if self.rate > self.best + self.tolerance:
+            self.best = self.rate
+            self.stale = 0
+        else:
+            self.stale += 1
+
+        if self.target is not None and self.rate >= self.target:
+            return True
+
+        return self.patience is not None and self.stale >= self.patience
+
+
+class Monitor:
+    """Rolling analytics of a training run, updated as games finish and as the table changes
+
+    Rates are exponential moving averages, and the entropy of a state is only recomputed when its
+    beads change, so nothing ever rescans the table.
+
+    :param window: Games the rolling rates mostly average over
+    :type window: int
+    :param path: File to append reports to as JSON lines, '-' for standard error or None for no reports
+    :type path: str
+    :param every: Games between reports
+    :type every: int
+    :param stop: Early stopping criterion, or None to never stop early
+    :type stop: EarlyStop
+    :param check_every: Games between checks of the criterion
+    :type check_every: int
+    """
+
+    def __init__(self, window=1000, path=None, every=10000, stop=None, check_every=10000):
+        self.decay = 1 - 1 / window
+        self.path = path
+        self.every = every
+        self.stop = stop
+        self.check_every = check_every
+
+        self.games = 0
+        self.rates = [0.0, 0.0, 0.0]  # Crosses wins, draws and naughts wins
+        self.change = 0.0  # Beads changed per game
+        self.pending = 0  # Beads changed since games were last added
+        self.entropies = {}  # Entropy of each state whose beads have changed
+        self.total_entropy = 0.0
+        self.stopped = False
+        self.reported = None  # Games at the last report
+        self.started = time.perf_counter()
+
+    def watch(self, deltas):
+        """Takes in changes to the game state table
+
+        :param deltas: Changes as (index into the table, change) pairs
+        :type deltas: list of tuple
+        """
+        codes = set()
+        for i, delta in deltas:
+            self.pending += abs(delta)
+            codes.add(i // logic.CELLS)
+
+        for code in codes:
+            value = entropy(machine.GAMESTATES[code])
+            self.total_entropy += value - self.entropies.get(code, 0.0)
+            self.entropies[code] = value
+
+    def add(self, crosses, draws, naughts):
+        """Takes in the results of games that have finished
+
+        :param crosses: Number of crosses wins
+        :type crosses: int
+        :param draws: Number of draws
+        :type draws: int
+        :param naughts: Number of naughts wins
+        :type naughts: int
+        """
+        games = crosses + draws + naughts
+        if not games:
+            return
+
+        weight = self.decay ** games
+        for i, count in enumerate((crosses, draws, naughts)):
+            self.rates[i] = self.rates[i] * weight + (1 - weight) * count / games
+        self.change = self.change * weight + (1 - weight) * self.pending / games
+        self.pending = 0
+
+        previous, self.games = self.games, self.games + games
+        if self.stop is not None and self.games // self.check_every > previous // self.check_every:
+            self.stopped = self.stop.check()
+            self.report()
+        elif self.path and self.games // self.every > previous // self.every:
+            self.report()
+
+    def game(self, winner):
+        """Takes in the result of one game
+
+        :param winner: Result of the game
+        :type winner: logic.Win
+        """
+        if winner == logic.Win.CROSS_WIN:
+            self.add(1, 0, 0)
+        elif winner == logic.Win.DRAW:
+            self.add(0, 1, 0)
+        else:
+            self.add(0, 0, 1)
+
+    def summary(self):
+        """Summarises the run so far
+
+        :return: Summary
+        :rtype: dict
+        """
+        # Moving averages start from nothing, so scale them up by the weight given to the games so far
+        seen = 1 - self.decay ** self.games or 1.0
+        crosses, draws, naughts = (rate / seen for rate in self.rates)
+
+        return {
+            'elapsed_s': time.perf_counter() - self.started,
+            'games': self.games,
+            'crosses': {'win': crosses, 'draw': draws, 'loss': naughts},
+            'naughts': {'win': naughts, 'draw': draws, 'loss': crosses},
+            'states': len(self.entropies),
+            'mean_entropy_bits': self.total_entropy / len(self.entropies) if self.entropies else 0.0,
+            'beads_changed_per_game': self.change / seen,
+            'solver_draw_rate': self.stop.rate if self.stop is not None else None,
+            'stopped': self.stopped,
+        }
+
+    def report(self):
+        """Writes a summary to the report file
+        """
+        if not self.path or self.reported == self.games:
+            return
+
+        self.reported = self.games
+        line = json.dumps(self.summary())
+        if self.path == '-':
+            print(line, file=sys.stderr)
+        else:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+    def start(self):
+        """Starts watching the changes made to the game state table
+        """
+        machine.WATCHERS.append(self.watch)
+
+    def close(self):
+        """Stops watching the table and writes a last summary
+        """
+        if self.watch in machine.WATCHERS:
+            machine.WATCHERS.remove(self.watch)
+        self.report()
@@ -0,0 +1,527 @@
+import array
+import collections
+import mmap
+import sqlite3
+import struct
+import sys
+
+# Size of the table of the 3 x 3 board: one row per base 3 state code and one column per block
+STATES = 3 ** 9
+MOVES = 9
+
+# Number of blocks on the board, the base 3 digit of each block value and the value of each block position
+CELLS = MOVES
+DIGITS = {0: 0, 1: 1, -1: 2}
+VALUES = (0, 1, -1)
+POWERS = tuple(3 ** i for i in range(CELLS))
+
+# File header: magic, layout version, save count, rows and columns
+HEADER = struct.Struct('<4sIIII')
+MAGIC = b'MNCE'
+VERSION = 1
+
+# File header of sparse tables: magic, layout version, save count, blocks and states,
+# with each state stored as its code followed by its bead counts
+SPARSE_HEADER = struct.Struct('<4sIIII')
+SPARSE_MAGIC = b'MNCS'
+SPARSE_CODE = struct.Struct('<Q')
+
+# Rough memory taken by each state held in memory by a tiered table on top of its bead counts, and by each
+# code in the symmetry cache, which is limited to as many codes as the table holds states
+ROW_OVERHEAD = 200
+CACHE_OVERHEAD = 280
+
+
+def configure(cells):
+    """Sets the number of blocks on the board that states are coded for
+
+    :param cells: Number of blocks
+    :type cells: int
+    """
+    global CELLS, POWERS
+
+    CELLS = cells
+    POWERS = tuple(3 ** i for i in range(cells))
+
+
+def encode(state):
+    """Converts the values of each block into a base 3 state code
+
+    :param state: Values of each block
+    :type state: iterable of int
+    :return: State code
+    :rtype: int
+    """
+    code = 0
+    for i, x in enumerate(state):
+        code += DIGITS[x] * POWERS[i]
+
+    return code
+
+
+def decode(code):
+    """Converts a base 3 state code back into the values of each block
+
+    :param code: State code
+    :type code: int
+    :return: Values of each block
+    :rtype: tuple of int
+    """
+    state = []
+    for _ in range(CELLS):
+        code, digit = divmod(code, 3)
+        state.append(VALUES[digit])
+
+    return tuple(state)
+
+
+class PolicyStore:
+    """Bead counts of every state held in one flat table indexed by state code
+
+    Rows are writable views into the table, so ``store[code][move] += 3`` updates the table in place.
+    States that were never given beads have a row of zeros.
+
+    :param table: Table of STATES x MOVES bead counts, empty if not given
+    :type table: array.array
+    """
+
+    def __init__(self, table=None):
+        if table is None:
+            table = array.array('i', bytes(STATES * MOVES * 4))
+
+        self.table = table
+        self.rows = memoryview(table)
+        self.map = None
+
+    def __getitem__(self, code):
+        start = code * MOVES
+        return self.rows[start:start + MOVES]
+
+    def __setitem__(self, code, counts):
+        start = code * MOVES
+        self.rows[start:start + MOVES] = array.array('i', counts)
+
+    def add(self, index, delta):
+        """Changes one bead count
+
+        :param index: Index into the table, the state code times MOVES plus the block
+        :type index: int
+        :param delta: Change in beads
+        :type delta: int
+        """
+        self.table[index] += delta
+
+    def __contains__(self, code):
+        return any(self[code])
+
+    def __iter__(self):
+        for code in range(STATES):
+            if code in self:
+                yield code
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def items(self):
+        for code in self:
+            yield code, self[code]
+
+    def save(self, f, savecount=0):
+        """Writes the table to a file as a header followed by the raw little endian table
+
+        :param f: File opened for binary writing
+        :type f: io.BufferedWriter
+        :param savecount: Number of times the table has been saved
+        :type savecount: int
+        """
+        f.write(HEADER.pack(MAGIC, VERSION, savecount, STATES, MOVES))
+
+        if sys.byteorder == 'little':
+            self.table.tofile(f)
+        else:
+            table = array.array('i', self.table)
+            table.byteswap()
+            table.tofile(f)
+
+    @classmethod
+    def load(cls, f):
+        """Reads a table written by save
+
+        :param f: File opened for binary reading
+        :type f: io.BufferedReader
+        :return: Store holding the table and the save count
+        :rtype: tuple
+        """
+        magic, version, savecount, states, moves = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or (states, moves) != (STATES, MOVES):
+            raise ValueError('Not a policy file of this layout')
+
+        table = array.array('i')
+        table.fromfile(f, STATES * MOVES)
+        if sys.byteorder != 'little':
+            table.byteswap()
+
+        return cls(table), savecount
+
+    @classmethod
+    def open(cls, path, writable=False):
+        """Maps a file written by save straight into memory without reading or converting it
+
+        Read only maps of the same file share one copy of the table between processes. Writable maps
+        are private copy on write views, so changes are never written back to the file.
+
+        :param path: Path of the policy file
+        :type path: str
+        :param writable: Whether the table may be changed
+        :type writable: bool
+        :return: Store viewing the mapped table and the save count
+        :rtype: tuple
+        """
+        if sys.byteorder != 'little':
+            raise ValueError('Policy files can only be mapped on little endian machines')
+
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY if writable else mmap.ACCESS_READ)
+
+        magic, version, savecount, states, moves = HEADER.unpack_from(mapped)
+        if magic != MAGIC or version != VERSION or (states, moves) != (STATES, MOVES):
+            mapped.close()
+            raise ValueError('Not a policy file of this layout')
+
+        store = cls(memoryview(mapped)[HEADER.size:HEADER.size + STATES * MOVES * 4].cast('i'))
+        store.map = mapped
+
+        return store, savecount
+
+    def close(self):
+        """Releases the mapped file of a store made by open
+        """
+        if self.map is not None:
+            self.rows.release()
+            self.table.release()
+            self.map.close()
+            self.map = None
+
+
+class SparseStore:
+    """Bead counts of the states visited so far, for boards too large to hold every state
+
+    Each state is given the same number of beads on every empty block the first time it is looked up,
+    so memory grows with the states actually visited.
+
+    :param cells: Number of blocks on the board
+    :type cells: int
+    :param beads: Beads first put on each empty block
+    :type beads: int
+    """
+
+    def __init__(self, cells, beads=2):
+        self.cells = cells
+        self.beads = beads
+        self.rows = {}
+
+    def __getitem__(self, code):
+        try:
+            return self.rows[code]
+        except KeyError:
+            pass
+
+        row = array.array('i', [self.beads if x == 0 else 0 for x in decode(code)])
+        self.rows[code] = row
+
+        return row
+
+    def get(self, code):
+        """Getter for the bead counts of a state without adding it
+
+        :param code: State code
+        :type code: int
+        :return: Bead counts, or None if the state has not been visited
+        :rtype: array.array
+        """
+        return self.rows.get(code)
+
+    def __setitem__(self, code, counts):
+        self.rows[code] = array.array('i', counts)
+
+    def __contains__(self, code):
+        return code in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def items(self):
+        return self.rows.items()
+
+    def add(self, index, delta):
+        """Changes one bead count
+
+        :param index: State code times the number of blocks plus the block
+        :type index: int
+        :param delta: Change in beads
+        :type delta: int
+        """
+        code, move = divmod(index, self.cells)
+        self[code][move] += delta
+
+    def save(self, f, savecount=0):
+        """Writes every visited state to a file as its code followed by its little endian bead counts
+
+        :param f: File opened for binary writing
+        :type f: io.BufferedWriter
+        :param savecount: Number of times the table has been saved
+        :type savecount: int
+        """
+        f.write(SPARSE_HEADER.pack(SPARSE_MAGIC, VERSION, savecount, self.cells, len(self.rows)))
+
+        for code, row in self.rows.items():
+            if sys.byteorder != 'little':
+                row = array.array('i', row)
+                row.byteswap()
+            f.write(SPARSE_CODE.pack(code))
+            f.write(row.tobytes())
+
+    @classmethod
+    def load(cls, f):
+        """Reads a table written by save
+
+        :param f: File opened for binary reading
+        :type f: io.BufferedReader
+        :return: Store holding the table and the save count
+        :rtype: tuple
+        """
+        magic, version, savecount, cells, count = SPARSE_HEADER.unpack(f.read(SPARSE_HEADER.size))
+        if magic != SPARSE_MAGIC or version != VERSION or cells != CELLS:
+            raise ValueError('Not a sparse policy file of this board size')
+
+        store = cls(cells)
+        for _ in range(count):
+            code, = SPARSE_CODE.unpack(f.read(SPARSE_CODE.size))
+            row = array.array('i')
+            row.fromfile(f, cells)
+            if sys.byteorder != 'little':
+                row.byteswap()
+            store.rows[code] = row
+
+        return store, savecount
+
+
+class TieredStore:
+    """Bead counts of the states visited so far, keeping the most recently used states in memory within
+    a budget and the rest in a database file
+
+    The budget also covers a symmetry cache of as many codes as the states held in memory, so the limit
+    should be passed on to symmetry.limit_cache.
+
+    States are paged in from the database when looked up and written back to it when evicted. The database
+    is a scratch copy started empty, so the policy file written by save stays the lasting copy. Rows
+    should not be kept after other states are looked up, since changes made to an evicted row are lost.
+
+    :param cells: Number of blocks on the board
+    :type cells: int
+    :param path: Path of the database file
+    :type path: str
+    :param budget: Bytes of memory to hold states in
+    :type budget: int
+    :param beads: Beads first put on each empty block
+    :type beads: int
+    """
+
+    def __init__(self, cells, path, budget=64 << 20, beads=2):
+        self.cells = cells
+        self.beads = beads
+        self.path = path
+        self.limit = max(1, budget // (ROW_OVERHEAD + CACHE_OVERHEAD + 4 * cells))
+        self.rows = collections.OrderedDict()  # States in memory, least recently used first
+        self.count = 0
+
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode = OFF')
+        self.db.execute('PRAGMA synchronous = OFF')
+        self.db.execute('DROP TABLE IF EXISTS rows')
+        self.db.execute('CREATE TABLE rows (code INTEGER PRIMARY KEY, counts BLOB)')
+
+    def fetch(self, code):
+        """Reads the bead counts of a state from the database
+
+        :param code: State code
+        :type code: int
+        :return: Bead counts, or None if the state is not in the database
+        :rtype: array.array
+        """
+        found = self.db.execute('SELECT counts FROM rows WHERE code = ?', (code,)).fetchone()
+        if found is None:
+            return None
+
+        row = array.array('i')
+        row.frombytes(found[0])
+
+        return row
+
+    def keep(self, code, row):
+        """Holds a state in memory, evicting the least recently used states once over budget
+
+        :param code: State code
+        :type code: int
+        :param row: Bead counts
+        :type row: array.array
+        """
+        self.rows[code] = row
+        if len(self.rows) > self.limit:
+            evicted = [self.rows.popitem(last=False) for _ in range(len(self.rows) - self.limit)]
+            self.db.executemany('INSERT OR REPLACE INTO rows VALUES (?, ?)',
+                                ((code, row.tobytes()) for code, row in evicted))
+
+    def get(self, code):
+        """Getter for the bead counts of a state without adding it
+
+        :param code: State code
+        :type code: int
+        :return: Bead counts, or None if the state has not been visited
+        :rtype: array.array
+        """
+        row = self.rows.get(code)
+        if row is not None:
+            self.rows.move_to_end(code)
+            return row
+
+        row = self.fetch(code)
+        if row is not None:
+            self.keep(code, row)
+
+        return row
+
+    def __getitem__(self, code):
+        row = self.get(code)
+        if row is None:
+            row = array.array('i', [self.beads if x == 0 else 0 for x in decode(code)])
+            self.keep(code, row)
+            self.count += 1
+
+        return row
+
+    def __setitem__(self, code, counts):
+        if code not in self:
+            self.count += 1
+        self.rows.pop(code, None)
+        self.keep(code, array.array('i', counts))
+
+    def __contains__(self, code):
+        if code in self.rows:
+            return True
+
+        return self.db.execute('SELECT 1 FROM rows WHERE code = ?', (code,)).fetchone() is not None
+
+    def __iter__(self):
+        for code, _ in self.items():
+            yield code
+
+    def __len__(self):
+        return self.count
+
+    def items(self):
+        """Generates every state with a copy of its bead counts, reading them from the database
+
+        :return: State codes and bead counts
+        :rtype: generator of tuple
+        """
+        self.flush()
+        for code, counts in self.db.execute('SELECT code, counts FROM rows'):
+            row = array.array('i')
+            row.frombytes(counts)
+            yield code, row
+
+    def add(self, index, delta):
+        """Changes one bead count
+
+        :param index: State code times the number of blocks plus the block
+        :type index: int
+        :param delta: Change in beads
+        :type delta: int
+        """
+        code, move = divmod(index, self.cells)
+        self[code][move] += delta
+
+    def flush(self):
+        """Writes the states held in memory to the database, keeping them in memory
+        """
+        self.db.executemany('INSERT OR REPLACE INTO rows VALUES (?, ?)',
+                            ((code, row.tobytes()) for code, row in self.rows.items()))
+        self.db.commit()
+
+    def save(self, f, savecount=0):
+        """Writes every visited state to a file in the layout of SparseStore.save, streaming it from the database
+
+        :param f: File opened for binary writing
+        :type f: io.BufferedWriter
+        :param savecount: Number of times the table has been saved
+        :type savecount: int
+        """
+        f.write(SPARSE_HEADER.pack(SPARSE_MAGIC, VERSION, savecount, self.cells, self.count))
+
+        for code, row in self.items():
+            if sys.byteorder != 'little':
+                row.byteswap()
+            f.write(SPARSE_CODE.pack(code))
+            f.write(row.tobytes())
+
+    @classmethod
+    def load(cls, f, path, budget=64 << 20):
+        """Reads a table written by save or SparseStore.save straight into the database
+
+        :param f: File opened for binary reading
+        :type f: io.BufferedReader
+        :param path: Path of the database file
+        :type path: str
+        :param budget: Bytes of memory to hold states in
+        :type budget: int
+        :return: Store holding the table and the save count
+        :rtype: tuple
+        """
+        magic, version, savecount, cells, count = SPARSE_HEADER.unpack(f.read(SPARSE_HEADER.size))
+        if magic != SPARSE_MAGIC or version != VERSION or cells != CELLS:
+            raise ValueError('Not a sparse policy file of this board size')
+
+        store = cls(cells, path, budget)
+        size = SPARSE_CODE.size + 4 * cells
+
+        def rows():
+            for _ in range(count):
+                data = f.read(size)
+                code, = SPARSE_CODE.unpack_from(data)
+                row = array.array('i', data[SPARSE_CODE.size:])
+                if sys.byteorder != 'little':
+                    row.byteswap()
+                yield code, row.tobytes()
+
+        store.db.executemany('INSERT INTO rows VALUES (?, ?)', rows())
+        store.db.commit()
+        store.count = count
+
+        return store, savecount
+
+    def close(self):
+        """Writes the states held in memory to the database and closes it
+        """
+        self.flush()
+        self.db.close()
+
+
+def load(f):
+    """Reads a table written by either store, depending on its header
+
+    :param f: File opened for binary reading
+    :type f: io.BufferedReader
+    :return: Store holding the table and the save count
+    :rtype: tuple
+    """
+    magic = f.read(len(SPARSE_MAGIC))
+    f.seek(-len(magic), 1)
+
+    if magic == SPARSE_MAGIC:
+        return SparseStore.load(f)
+
+    return PolicyStore.load(f)
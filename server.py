@@ -0,0 +1,326 @@
+import argparse
+import asyncio
+import signal
+import sys
+import time
+import gamelog
+import logic
+import machine
+import stats
+
+# Seconds between saves of the policy while serving
+SAVE_INTERVAL = 10.0
+
+# Line protocol, one request and one reply per line:
+#   on connecting        <- HELLO <size> <win length>
+#   NEW X or NEW O       -> start a game playing crosses or naughts, the machine playing the other side
+#   PLAY <block>         -> play a block
+#   QUIT                 -> close the connection
+# Replies to NEW and PLAY are MOVE <block> with the machine's move, or - if it has not moved,
+# END <result> <block or -> once the game has ended, or ERR <reason>.
+SIDES = {'X': logic.State.CROSS, 'O': logic.State.NAUGHT}
+
+
+class Session:
+    """Games played one after another over one connection against a machine sharing the global table
+
+    :param results: Queue to put finished games on for learning
+    :type results: asyncio.Queue
+    """
+
+    def __init__(self, results):
+        self.results = results
+        self.game = logic.Game()
+        self.player = None
+        self.side = None  # Side the machine plays
+
+    def reply(self, move):
+        """Reply after a move, ending the game if it is over
+
+        :param move: Block the machine played, or None
+        :type move: int
+        :return: Reply line
+        :rtype: str
+        """
+        block = '-' if move is None else str(move)
+        if self.game.result == logic.Win.NOT_END:
+            return f'MOVE {block}'
+
+        # Learning waits for the learner task, so the reply is not held up by it
+        self.results.put_nowait((self.player, self.side, self.game.result, list(self.game.history)))
+        self.player = None
+
+        return f'END {self.game.result.name} {block}'
+
+    def start(self, side):
+        """Starts a new game
+
+        :param side: Side the client plays
+        :type side: logic.State
+        :return: Reply line
+        :rtype: str
+        """
+        self.game.reset()
+        self.player = machine.Machine()  # Own moves played, so finished games can be learned from later
+        self.side = logic.State(-side)
+
+        move = None
+        if self.side == logic.State.CROSS:
+            move = self.player.think(self.game)
+
+        return self.reply(move)
+
+    def play(self, index):
+        """Plays the client's move and the machine's reply
+
+        :param index: Block the client plays
+        :type index: int
+        :return: Reply line
+        :rtype: str
+        """
+        if self.player is None:
+            raise ValueError('No game in progress')
+
+        self.game.play(index)
+        if self.game.result != logic.Win.NOT_END:
+            return self.reply(None)
+
+        return self.reply(self.player.think(self.game))
+
+    def handle(self, line):
+        """Answers one request
+
+        :param line: Request line
+        :type line: str
+        :return: Reply line
+        :rtype: str
+        """
+        words = line.split()
+        try:
+            if len(words) == 2 and words[0] == 'NEW' and words[1] in SIDES:
+                return self.start(SIDES[words[1]])
+            if len(words) == 2 and words[0] == 'PLAY':
+                return self.play(int(words[1]))
+        except ValueError as e:
+            return f'ERR {e}'
+
+        return 'ERR Unknown request'
+
+
+async def connect(reader, writer, results):
+    """Serves one connection until it quits or closes
+
+    :param reader: Connection reader
+    :type reader: asyncio.StreamReader
+    :param writer: Connection writer
+    :type writer: asyncio.StreamWriter
+    :param results: Queue to put finished games on
+    :type results: asyncio.Queue
+    """
+    session = Session(results)
+    writer.write(f'HELLO {logic.SIZE} {logic.WIN_LENGTH}\n'.encode())
+
+    try:
+        while True:
+            line = await reader.readline()
+            if not line or line.strip() == b'QUIT':
+                break
+
+            writer.write((session.handle(line.decode()) + '\n').encode())
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def apply(player, side, result):
+    """Rewards, punishes or draws a machine for a finished game
+
+    :param player: Machine that played the game
+    :type player: machine.Machine
+    :param side: Side the machine played
+    :type side: logic.State
+    :param result: Result of the game
+    :type result: logic.Win
+    """
+    if result == logic.Win.DRAW:
+        player.draw()
+    elif (result == logic.Win.CROSS_WIN) == (side == logic.State.CROSS):
+        player.reward()
+    else:
+        player.punish()
+
+
+def finish(player, side, result, moves, log=None, learning=True):
+    """Learns from a finished game and logs it
+
+    :param player: Machine that played the game
+    :type player: machine.Machine
+    :param side: Side the machine played
+    :type side: logic.State
+    :param result: Result of the game
+    :type result: logic.Win
+    :param moves: Blocks played on each move
+    :type moves: list of int
+    :param log: Game log to append the game to
+    :type log: gamelog.GameLog
+    :param learning: Whether to learn from the game, or only log it
+    :type learning: bool
+    """
+    if learning:
+        apply(player, side, result)
+    if log is not None:
+        log.add(moves, result)
+
+
+async def save(log=None, learning=True):
+    """Saves the policy and flushes the game log, writing to disk on another thread so that sessions
+    are not held up while it waits for the disk
+
+    :param log: Game log to flush
+    :type log: gamelog.GameLog
+    :param learning: Whether to save the policy, or only flush the log
+    :type learning: bool
+    """
+    if learning:
+        machine.resume(await asyncio.to_thread(machine.snapshot()))
+    if log is not None:
+        await asyncio.to_thread(log.flush)
+
+
+async def learn(results, save_interval, log=None, learning=True):
+    """Applies the rewards of finished games to the shared table and saves it now and then
+
+    Saves run on a timer, so what was learned and logged reaches the disk even once the server goes idle.
+
+    :param results: Queue of (machine, side it played, result, blocks played) of each finished game,
+        ending with None
+    :type results: asyncio.Queue
+    :param save_interval: Seconds between saves, or 0 to never save
+    :type save_interval: float
+    :param log: Game log to append finished games to
+    :type log: gamelog.GameLog
+    :param learning: Whether to learn from finished games, or only log them
+    :type learning: bool
+    """
+    next_save = time.monotonic() + save_interval
+    unsaved = False  # Whether games have finished since the last save
+    while True:
+        timeout = max(next_save - time.monotonic(), 0) if save_interval else None
+        try:
+            result = await asyncio.wait_for(results.get(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        else:
+            if result is None:
+                break
+
+            finish(*result, log, learning)
+            unsaved = True
+
+        if save_interval and time.monotonic() >= next_save:
+            if unsaved:
+                await save(log, learning)
+                unsaved = False
+            next_save = time.monotonic() + save_interval
+
+
+def stopped(learner):
+    """Reports a learner task that has died, since sessions keep being served without it
+
+    :param learner: Learner task
+    :type learner: asyncio.Task
+    """
+    if not learner.cancelled() and learner.exception() is not None:
+        print(f'Learner stopped: {learner.exception()!r}', file=sys.stderr)
+
+
+async def serve(host='127.0.0.1', port=7878, path=None, save_interval=SAVE_INTERVAL, log=None, learning=True):
+    """Serves games until cancelled or sent SIGTERM
+
+    Servers that do not learn play from a read only table, such as one mapped by machine.map_policy,
+    and share their port so that several processes can serve from one copy of the table.
+
+    :param host: Address to listen on
+    :type host: str
+    :param port: Port to listen on
+    :type port: int
+    :param path: Path of a local socket to listen on instead of TCP
+    :type path: str
+    :param save_interval: Seconds between saves, or 0 to never save
+    :type save_interval: float
+    :param log: Game log to append finished games to
+    :type log: gamelog.GameLog
+    :param learning: Whether to learn from finished games, or only log them
+    :type learning: bool
+    """
+    results = asyncio.Queue()
+
+    def accept(reader, writer):
+        return connect(reader, writer, results)
+
+    if path:
+        server = await asyncio.start_unix_server(accept, path)
+    else:
+        server = await asyncio.start_server(accept, host, port, backlog=4096, reuse_port=not learning)
+
+    learner = asyncio.create_task(learn(results, save_interval, log, learning))
+    learner.add_done_callback(stopped)
+
+    # Stop on SIGTERM as on Ctrl-C, so the last save still runs
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass
+    print(f'Serving on {path or f"{host}:{port}"}', file=sys.stderr)
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        # Let the learner finish the games left and any save it is part way through
+        results.put_nowait(None)
+        await asyncio.wait([learner])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve games against the machine over a line protocol')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=7878, help='port to listen on')
+    parser.add_argument('--unix', help='path of a local socket to listen on instead of TCP')
+    parser.add_argument('--save-interval', type=float, default=SAVE_INTERVAL,
+                        help='seconds between saves of the policy, 0 to never save')
+    parser.add_argument('--size', type=int, default=3, help='number of blocks along each side of the board')
+    parser.add_argument('--win-length', type=int, default=3, help='number of blocks in a row needed to win')
+    parser.add_argument('--log', help='game log to append every finished game to, which read only servers '
+                                      'may share')
+    parser.add_argument('--read-only', action='store_true',
+                        help='play from the mapped policy file without learning, sharing it and the port '
+                             'with other read only servers')
+    args = parser.parse_args()
+
+    if args.read_only and args.size != 3:
+        parser.error('--read-only only supports the 3 x 3 board')
+
+    machine.configure(args.size, args.win_length)
+    stats.setup({'server': sys.modules[__name__]})
+    if args.read_only:
+        machine.map_policy()
+    else:
+        machine.load_policy()
+    log = gamelog.GameLog(args.log) if args.log else None
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.save_interval, log, not args.read_only))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    finally:
+        if not args.read_only:
+            machine.save_policy()
+        if log is not None:
+            log.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import os
+import random
+import logic
+import machine
+import policy
+import symmetry
+
+SOLUTION_FILE = 'SOLUTION.bin'
+
+# Game value of each canonical state code for the side to move, stored as value + 1
+# (0 for a loss, 1 for a draw and 2 for a win) with UNKNOWN for states not solved yet
+UNKNOWN = 0xFF
+VALUES = None
+
+
+def load_solution():
+    """Loads the solved values from the solution file, solving and saving them if there is no file
+    or it does not hold a value for every state
+    """
+    global VALUES
+
+    if (logic.SIZE, logic.WIN_LENGTH) != (3, 3):
+        raise ValueError('Only the 3 x 3 board with 3 in a row can be solved')
+
+    if os.path.exists(SOLUTION_FILE):
+        with open(SOLUTION_FILE, 'rb') as f:
+            VALUES = bytearray(f.read())
+        if len(VALUES) == policy.STATES:
+            return
+
+    VALUES = bytearray([UNKNOWN]) * policy.STATES
+    solve(0)
+
+    temp = SOLUTION_FILE + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(VALUES)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, SOLUTION_FILE)
+
+
+def turn_of(state):
+    """Finds whose turn it is in a game state
+
+    :param state: Values of each block
+    :type state: tuple of int
+    :return: Side to move
+    :rtype: logic.State
+    """
+    return logic.State.CROSS if state.count(1) == state.count(-1) else logic.State.NAUGHT
+
+
+def solve(code):
+    """Finds the value of a game state under perfect play by negamax over the transposition table
+
+    :param code: State code
+    :type code: int
+    :return: 1 if the side to move wins, 0 for a draw and -1 if it loses
+    :rtype: int
+    """
+    if VALUES is None:
+        load_solution()
+
+    canon = symmetry.canonical(code)[0]
+    value = VALUES[canon]
+    if value != UNKNOWN:
+        return value - 1
+
+    best = max(v for v in move_values(canon) if v is not None)
+    VALUES[canon] = best + 1
+
+    return best
+
+
+def move_values(code):
+    """Finds the value of playing each block under perfect play
+
+    :param code: State code
+    :type code: int
+    :return: Value for the side to move of playing each block, None for blocks that are taken
+    :rtype: list
+    """
+    state = policy.decode(code)
+    turn = turn_of(state)
+    digit = policy.DIGITS[turn]
+    crosses, naughts = logic.to_bitboard(state)
+
+    values = [None] * 9
+    for i, x in enumerate(state):
+        if x != 0:
+            continue
+
+        if turn == logic.State.CROSS:
+            result = logic.check_bitboard(crosses | 1 << i, naughts)
+        else:
+            result = logic.check_bitboard(crosses, naughts | 1 << i)
+
+        if result == logic.Win.NOT_END:
+            values[i] = -solve(code + digit * policy.POWERS[i])
+        elif result == logic.Win.DRAW:
+            values[i] = 0
+        else:
+            values[i] = 1
+
+    return values
+
+
+def optimal_moves(code):
+    """Finds every move that keeps the best value under perfect play
+
+    :param code: State code
+    :type code: int
+    :return: Indices of the optimal blocks
+    :rtype: list of int
+    """
+    values = move_values(code)
+    best = max(v for v in values if v is not None)
+
+    return [i for i, v in enumerate(values) if v == best]
+
+
+def audit():
+    """Scores every reachable state of the game state table against the optimal moves
+
+    :return: For each state code, the share of beads on optimal moves and whether the move with
+        the most beads is optimal
+    :rtype: dict
+    """
+    scores = {}
+    for code in machine.reachable_states():
+        counts = machine.GAMESTATES[code]
+        total = sum(counts)
+        if not total:
+            continue
+
+        optimal = optimal_moves(code)
+        greedy = max(range(9), key=counts.__getitem__)
+        scores[code] = (sum(counts[i] for i in optimal) / total, greedy in optimal)
+
+    return scores
+
+
+class Solver:
+    """Player making a random choice among the optimal moves of each position
+    """
+
+    def choose(self, code):
+        """Pick an optimal move for a game state
+
+        :param code: State code of the blocks
+        :type code: int
+        :return: Index of the chosen block
+        :rtype: int
+        """
+        return random.choice(optimal_moves(code))
+
+    def think(self, game):
+        """Play an optimal move
+
+        :param game: Game to play in
+        :type game: logic.Game
+        :return: Index of the played block
+        :rtype: int
+        """
+        choice = self.choose(game.code)
+        game.play(choice)
+
+        return choice
+
+    def reward(self):
+        pass
+
+    def punish(self):
+        pass
+
+    def draw(self):
+        pass
+
+
+if __name__ == '__main__':
+    machine.load_policy()
+    scores = audit()
+
+    shares = [share for share, _ in scores.values()]
+    greedy = sum(ok for _, ok in scores.values())
+    print(f'States: {len(scores)}')
+    print(f'Beads on optimal moves: {sum(shares) / len(shares):.1%}')
+    print(f'Greedy move optimal: {greedy / len(scores):.1%}')
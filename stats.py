@@ -0,0 +1,184 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import time
+
+# Functions to time: module, class (or None for module functions), function name and phase name
+TARGETS = (
+    ('pygame.event', None, 'get', 'events'),
+    ('logic', None, 'check_end', 'check_end'),
+    ('logic', None, 'check_bitboard', 'check_bitboard'),
+    ('machine', 'Machine', 'think', 'think'),
+    ('machine', 'Machine', 'choose', 'move'),
+    ('solver', 'Solver', 'choose', 'move'),
+    ('machine', 'Machine', 'reward', 'learn'),
+    ('machine', 'Machine', 'punish', 'learn'),
+    ('machine', 'Machine', 'draw', 'learn'),
+    ('machine', None, 'save_policy', 'save'),
+    ('machine', None, 'compact', 'compact'),
+    ('train', None, 'play', 'game'),
+    ('server', 'Session', 'handle', 'request'),
+    ('game', 'GameHandler', 'reset', 'game'),
+    ('game', 'GameHandler', 'click', 'click'),
+    ('game', 'GameHandler', 'draw', 'draw'),
+)
+
+PHASES = {}
+PATH = None
+INTERVAL = 10.0
+NEXT_DUMP = 0.0
+STARTED = 0.0
+
+
+class Phase:
+    """Running totals of the calls of one phase
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.longest = 0.0
+        self.last = None
+        self.period = 0.0
+
+    def add(self, start, end):
+        """Adds one call
+
+        :param start: Time the call started
+        :type start: float
+        :param end: Time the call ended
+        :type end: float
+        """
+        duration = end - start
+        self.calls += 1
+        self.total += duration
+        if duration > self.longest:
+            self.longest = duration
+        if self.last is not None:
+            self.period += start - self.last
+        self.last = start
+
+    def summary(self):
+        return {
+            'calls': self.calls,
+            'total_ms': self.total * 1e3,
+            'mean_us': self.total / self.calls * 1e6 if self.calls else 0.0,
+            'max_us': self.longest * 1e6,
+            'period_ms': self.period / (self.calls - 1) * 1e3 if self.calls > 1 else 0.0,
+        }
+
+
+def timed(function, phase):
+    """Wraps a function to add the time of each call to a phase
+
+    :param function: Function to wrap
+    :type function: callable
+    :param phase: Totals to add to
+    :type phase: Phase
+    :return: Wrapped function
+    :rtype: callable
+    """
+    clock = time.perf_counter
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            end = clock()
+            phase.add(start, end)
+            if end >= NEXT_DUMP:
+                dump()
+
+    wrapper.untimed = function
+    return wrapper
+
+
+def enable(path='-', interval=10.0, modules=None):
+    """Times the hot paths of every loaded module and dumps summaries while running
+
+    Nothing is wrapped until this is called, so the game and learner run at full speed without it.
+
+    :param path: File to append summaries to as JSON lines, or '-' for standard error
+    :type path: str
+    :param interval: Seconds between summaries
+    :type interval: float
+    :param modules: Modules to use in place of the loaded module of the same name, such as a game run as __main__
+    :type modules: dict
+    """
+    global PATH, INTERVAL, NEXT_DUMP, STARTED
+
+    modules = dict(modules or {})
+    for module_name, class_name, function_name, phase_name in TARGETS:
+        module = modules.get(module_name, sys.modules.get(module_name))
+        if module is None:
+            continue
+
+        owner = getattr(module, class_name) if class_name else module
+        function = getattr(owner, function_name)
+        if hasattr(function, 'untimed'):
+            continue
+
+        phase = PHASES.setdefault(phase_name, Phase())
+        setattr(owner, function_name, timed(function, phase))
+
+    PATH = path
+    INTERVAL = interval
+    STARTED = time.perf_counter()
+    NEXT_DUMP = STARTED + interval
+
+    atexit.register(dump)
+
+
+def setup(modules=None):
+    """Turns instrumentation on if the TICTACTOE_STATS environment variable names a stats file
+
+    TICTACTOE_STATS_INTERVAL sets the seconds between summaries.
+
+    :param modules: Modules to use in place of the loaded module of the same name
+    :type modules: dict
+    :return: Whether instrumentation was turned on
+    :rtype: bool
+    """
+    path = os.environ.get('TICTACTOE_STATS')
+    if not path:
+        return False
+
+    enable(path, float(os.environ.get('TICTACTOE_STATS_INTERVAL', 10.0)), modules)
+    return True
+
+
+def summary():
+    """Summarises every phase along with counts of moves, games and the size of the game state table
+
+    :return: Summary
+    :rtype: dict
+    """
+    machine = sys.modules.get('machine')
+
+    phases = {name: phase.summary() for name, phase in PHASES.items()}
+    return {
+        'elapsed_s': time.perf_counter() - STARTED,
+        'moves': phases.get('move', {}).get('calls', 0),
+        'games': phases.get('game', {}).get('calls', 0),
+        'table_size': len(machine.GAMESTATES) if machine else None,
+        'phases': phases,
+    }
+
+
+def dump():
+    """Writes a summary to the stats file
+    """
+    global NEXT_DUMP
+
+    NEXT_DUMP = time.perf_counter() + INTERVAL
+    line = json.dumps(summary())
+
+    if PATH == '-':
+        print(line, file=sys.stderr)
+    else:
+        with open(PATH, 'a') as f:
+            f.write(line + '\n')
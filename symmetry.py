@@ -0,0 +1,137 @@
+import array
+import collections
+import policy
+
+
+def _transforms(size):
+    """Generates the permutation of block indices for each symmetry of the board
+
+    :param size: Number of blocks along each side of the board
+    :type size: int
+    :return: For each symmetry, the block each index of the transformed board is taken from
+    :rtype: list of tuple of int
+    """
+    n = size - 1
+    maps = (
+        lambda r, c: (r, c),
+        lambda r, c: (c, n - r),
+        lambda r, c: (n - r, n - c),
+        lambda r, c: (n - c, r),
+        lambda r, c: (r, n - c),
+        lambda r, c: (n - r, c),
+        lambda r, c: (c, r),
+        lambda r, c: (n - c, n - r),
+    )
+
+    perms = []
+    for f in maps:
+        perm = []
+        for i in range(size * size):
+            r, c = f(i // size, i % size)
+            perm.append(size * r + c)
+        perms.append(tuple(perm))
+
+    return perms
+
+
+def configure(size=3, limit=None):
+    """Sets the size of the board to fold states of
+
+    The canonical form of each state of the 3 x 3 board is cached in flat arrays indexed by state code.
+    Larger boards have too many states for that, so theirs are cached as they are seen, keeping only the
+    most recently used codes if given a limit.
+
+    :param size: Number of blocks along each side of the board
+    :type size: int
+    :param limit: Number of codes of larger boards to cache, or None to cache every code seen
+    :type limit: int
+    """
+    global SYMMETRIES, INVERSES, CANONICAL_CODES, CODE_SYMMETRIES, CACHE, CACHE_LIMIT
+
+    # Permutation tables: SYMMETRIES[k][j] is the block that index j of the canonical board comes from
+    # and INVERSES[k][i] is the index on the canonical board that block i goes to
+    SYMMETRIES = _transforms(size)
+    INVERSES = [tuple(perm.index(i) for i in range(size * size)) for perm in SYMMETRIES]
+
+    # Canonical code and symmetry of each state code, filled in the first time a code is seen
+    if size * size == policy.MOVES:
+        CANONICAL_CODES = array.array('i', [-1]) * policy.STATES
+        CODE_SYMMETRIES = bytearray(policy.STATES)
+        CACHE = None
+    else:
+        CANONICAL_CODES = CODE_SYMMETRIES = None
+        CACHE = collections.OrderedDict()  # Least recently used first
+    CACHE_LIMIT = limit
+
+
+def limit_cache(limit):
+    """Sets the number of codes of larger boards to cache, dropping the least recently used codes over it
+
+    :param limit: Number of codes to cache, or None to cache every code seen
+    :type limit: int
+    """
+    global CACHE_LIMIT
+
+    CACHE_LIMIT = limit
+    if CACHE is not None and limit is not None:
+        while len(CACHE) > limit:
+            CACHE.popitem(last=False)
+
+
+def canonical(code):
+    """Finds the canonical form of a game state, the smallest code of its 8 symmetric forms
+
+    :param code: State code
+    :type code: int
+    :return: Canonical state code and the index of the symmetry that produced it
+    :rtype: tuple of int
+    """
+    if CACHE is None:
+        canon = CANONICAL_CODES[code]
+        if canon >= 0:
+            return canon, CODE_SYMMETRIES[code]
+    elif code in CACHE:
+        CACHE.move_to_end(code)
+        return CACHE[code]
+
+    state = policy.decode(code)
+    canon, k = min((policy.encode(state[i] for i in perm), k) for k, perm in enumerate(SYMMETRIES))
+
+    if CACHE is None:
+        CANONICAL_CODES[code] = canon
+        CODE_SYMMETRIES[code] = k
+    else:
+        CACHE[code] = canon, k
+        if CACHE_LIMIT is not None and len(CACHE) > CACHE_LIMIT:
+            CACHE.popitem(last=False)
+
+    return canon, k
+
+
+def to_canonical(move, symmetry):
+    """Maps a block index on the board onto the canonical board
+
+    :param move: Index of the block
+    :type move: int
+    :param symmetry: Index of the symmetry returned by canonical
+    :type symmetry: int
+    :return: Index on the canonical board
+    :rtype: int
+    """
+    return INVERSES[symmetry][move]
+
+
+def from_canonical(move, symmetry):
+    """Maps a block index on the canonical board back onto the board
+
+    :param move: Index on the canonical board
+    :type move: int
+    :param symmetry: Index of the symmetry returned by canonical
+    :type symmetry: int
+    :return: Index of the block
+    :rtype: int
+    """
+    return SYMMETRIES[symmetry][move]
+
+
+configure()
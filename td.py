@@ -0,0 +1,152 @@
+import argparse
+import os
+import numpy as np
+import logic
+import batch
+import metrics
+import policy
+import train
+
+VALUES_FILE = 'VALUES.npy'
+
+# Value of each canonical state code for the side that just moved into it, from -1 for a loss to 1 for a win
+VALUES = None
+
+# Step size of each update and chance of playing a random move while learning
+ALPHA = 0.2
+EPSILON = 0.1
+
+
+def load_values():
+    """Loads the value table from the values file, starting every state at a draw if there is no file
+    """
+    global VALUES
+
+    if (logic.SIZE, logic.WIN_LENGTH) != (3, 3):
+        raise ValueError('Only the 3 x 3 board with 3 in a row has a value table')
+
+    if os.path.exists(VALUES_FILE):
+        VALUES = np.load(VALUES_FILE)
+    else:
+        VALUES = np.zeros(policy.STATES, dtype=np.float32)
+
+
+def save_values():
+    """Writes the value table to the values file, replacing it atomically
+    """
+    temp = VALUES_FILE + '.tmp'
+    with open(temp, 'wb') as f:
+        np.save(f, VALUES)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, VALUES_FILE)
+
+
+class TD:
+    """Player learning the value of the states its moves lead to by temporal difference learning
+
+    Each move leads to the afterstate with the highest value, and at the end of the game the value of every
+    afterstate played is moved towards the value of the next one, or the result for the last one.
+    Symmetric afterstates share one value, and both sides share the table since their afterstates never meet.
+
+    :param alpha: Step size of each update
+    :type alpha: float
+    :param epsilon: Chance of playing a random move, 0 to always play the best move
+    :type epsilon: float
+    :param rng: Random number generator for the moves
+    :type rng: numpy.random.Generator
+    """
+
+    def __init__(self, alpha=ALPHA, epsilon=EPSILON, rng=None):
+        self.alpha = alpha
+        self.epsilon = epsilon
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.played = []  # Canonical afterstates played this game
+
+    def choose(self, code):
+        """Pick the move leading to the afterstate with the highest value
+
+        :param code: State code of the blocks
+        :type code: int
+        :return: Index of the chosen block
+        :rtype: int
+        """
+        if VALUES is None:
+            load_values()
+
+        canonical_codes, _ = batch.canonical_tables()
+        digits = code // batch.POWERS % 3
+        empty = np.flatnonzero(digits == 0)
+        digit = policy.DIGITS[logic.State.CROSS if len(empty) % 2 else logic.State.NAUGHT]
+        after = canonical_codes[code + digit * batch.POWERS[empty]]
+
+        if self.rng.random() < self.epsilon:
+            i = self.rng.integers(len(empty))
+        else:
+            values = VALUES[after]
+            i = self.rng.choice(np.flatnonzero(values == values.max()))
+
+        self.played.append(after[i])
+        return int(empty[i])
+
+    def think(self, game):
+        """Play the move leading to the best afterstate
+
+        :param game: Game to play in
+        :type game: logic.Game
+        :return: Index of the played block
+        :rtype: int
+        """
+        choice = self.choose(game.code)
+        game.play(choice)
+
+        return choice
+
+    def learn(self, result):
+        """Moves the value of each afterstate played towards the value of the next one
+
+        :param result: Value of the end of the game for the player
+        :type result: float
+        """
+        played = np.array(self.played, dtype=np.int64)
+        values = VALUES[played]
+        VALUES[played] += self.alpha * (np.append(values[1:], result) - values)
+        self.played = []
+
+    def reward(self):
+        self.learn(1.0)
+
+    def punish(self):
+        self.learn(-1.0)
+
+    def draw(self):
+        self.learn(0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the temporal difference learner by self-play')
+    parser.add_argument('-n', '--games', type=int, default=20000, help='number of games to play')
+    parser.add_argument('--alpha', type=float, default=ALPHA, help='step size of each update')
+    parser.add_argument('--epsilon', type=float, default=EPSILON, help='chance of a random move while learning')
+    parser.add_argument('--check-every', type=int, default=1000, help='games between checks against the solver')
+    parser.add_argument('--eval-games', type=int, default=200, help='games against the solver of each check')
+    parser.add_argument('--seed', type=int, help='seed for the moves')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    load_values()
+
+    crosses = TD(args.alpha, args.epsilon, rng)
+    naughts = TD(args.alpha, args.epsilon, rng)
+    for count in range(1, args.games + 1):
+        train.play(crosses, naughts)
+
+        if args.check_every and count % args.check_every == 0:
+            rate = metrics.evaluate(args.eval_games, lambda: TD(epsilon=0, rng=rng))
+            print(f'Games: {count} Draw rate against the solver: {rate:.1%}')
+
+    save_values()
+
+
+if __name__ == '__main__':
+    main()
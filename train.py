@@ -0,0 +1,296 @@
+import argparse
+import array
+import multiprocessing
+import random
+import sys
+import time
+import logic
+import machine
+import metrics
+import policy
+import stats
+
+
+def play(crosses, naughts):
+    """Plays a single game between two machines without drawing anything
+
+    :param crosses: Machine playing crosses
+    :type crosses: machine.Machine
+    :param naughts: Machine playing naughts
+    :type naughts: machine.Machine
+    :return: Result of the game
+    :rtype: logic.Win
+    """
+    code = 0
+    bitboards = [0, 0]
+    player, digit, side = crosses, policy.DIGITS[logic.State.CROSS], 0
+
+    while True:
+        move = player.choose(code)
+        code += digit * policy.POWERS[move]
+        bitboards[side] |= 1 << move
+
+        winner = logic.check_bitboard(*bitboards)
+        if winner != logic.Win.NOT_END:
+            break
+
+        if side == 0:
+            player, digit, side = naughts, policy.DIGITS[logic.State.NAUGHT], 1
+        else:
+            player, digit, side = crosses, policy.DIGITS[logic.State.CROSS], 0
+
+    if winner == logic.Win.CROSS_WIN:
+        crosses.reward()
+        naughts.punish()
+    elif winner == logic.Win.NAUGHT_WIN:
+        crosses.punish()
+        naughts.reward()
+    else:
+        crosses.draw()
+        naughts.draw()
+
+    return winner
+
+
+def train(games=None, seconds=None, save_every=10000, monitor=None):
+    """Trains the game state dictionary by self-play until a game count or time budget runs out
+
+    :param games: Number of games to play
+    :type games: int
+    :param seconds: Time budget in seconds
+    :type seconds: float
+    :param save_every: Games between saves of the policy file
+    :type save_every: int
+    :param monitor: Analytics to pass each result to, which may stop training early
+    :type monitor: metrics.Monitor
+    :return: Number of games played and seconds taken
+    :rtype: tuple
+    """
+    crosses = machine.Machine()
+    naughts = machine.Machine()
+
+    start = time.perf_counter()
+    deadline = start + seconds if seconds else None
+
+    count = 0
+    while (games is None or count < games) and (deadline is None or time.perf_counter() < deadline):
+        winner = play(crosses, naughts)
+        count += 1
+
+        if save_every and count % save_every == 0:
+            machine.save_policy()
+
+        if monitor is not None:
+            monitor.game(winner)
+            if monitor.stopped:
+                break
+
+    return count, time.perf_counter() - start
+
+
+def freeze(store):
+    """Copies a game state table to send to a worker process
+
+    :param store: Game state table
+    :type store: policy.PolicyStore or policy.SparseStore
+    :return: Raw table of the 3 x 3 board, or the sparse table of larger boards to be pickled
+    :rtype: bytes or policy.SparseStore
+    """
+    if isinstance(store, policy.PolicyStore):
+        return store.table.tobytes()
+
+    return store
+
+
+def thaw(snapshot):
+    """Rebuilds a game state table sent to a worker process
+
+    :param snapshot: Copy made by freeze
+    :type snapshot: bytes or policy.SparseStore
+    :return: Game state table and its bead counts before any changes
+    :rtype: tuple
+    """
+    if isinstance(snapshot, bytes):
+        return policy.PolicyStore(array.array('i', snapshot)), array.array('i', snapshot)
+
+    return snapshot, {code: row.tolist() for code, row in snapshot.items()}
+
+
+def changes(store, before):
+    """Finds the changes made to a game state table rebuilt by thaw
+
+    :param store: Game state table
+    :type store: policy.PolicyStore or policy.SparseStore
+    :param before: Bead counts before any changes
+    :type before: array.array or dict
+    :return: Changes to the bead counts as (index into the table, change) pairs
+    :rtype: list of tuple
+    """
+    if isinstance(store, policy.PolicyStore):
+        return [(i, new - old) for i, (new, old) in enumerate(zip(store.table, before)) if new != old]
+
+    # States first visited in this batch started with the same beads the master table will give them
+    deltas = []
+    for code, row in store.items():
+        old = before.get(code) or machine.empty_beads(policy.decode(code), store.beads)
+        deltas.extend((code * store.cells + i, new - x) for i, (new, x) in enumerate(zip(row, old)) if new != x)
+
+    return deltas
+
+
+def play_batch(snapshot, games, seed=None):
+    """Plays a batch of games in a worker process against a snapshot of the game state table
+
+    :param snapshot: Copy of the game state table made by freeze
+    :type snapshot: bytes or policy.SparseStore
+    :param games: Number of games to play
+    :type games: int
+    :param seed: Seed for the random moves, or None to seed from the operating system
+    :type seed: int
+    :return: Changes to the bead counts as (index into the table, change) pairs and the crosses wins,
+        draws and naughts wins
+    :rtype: tuple
+    """
+    random.seed(seed)
+    machine.JOURNAL = None
+    machine.WATCHERS = []
+    machine.GAMESTATES, before = thaw(snapshot)
+
+    crosses = machine.Machine()
+    naughts = machine.Machine()
+    results = [0, 0, 0]
+    for _ in range(games):
+        winner = play(crosses, naughts)
+        if winner == logic.Win.CROSS_WIN:
+            results[0] += 1
+        elif winner == logic.Win.DRAW:
+            results[1] += 1
+        else:
+            results[2] += 1
+
+    return changes(machine.GAMESTATES, before), results
+
+
+def train_parallel(workers, games=None, seconds=None, sync=1000, seed=None, save_every=10000, monitor=None):
+    """Trains the game state table by self-play over a pool of worker processes
+
+    Each round every worker plays sync games against a snapshot of the table and the changes
+    of all workers are merged into the table before the next round.
+
+    :param workers: Number of worker processes
+    :type workers: int
+    :param games: Number of games to play
+    :type games: int
+    :param seconds: Time budget in seconds
+    :type seconds: float
+    :param sync: Games each worker plays between merges
+    :type sync: int
+    :param seed: Base seed giving every worker of every round its own deterministic seed
+    :type seed: int
+    :param save_every: Games between saves of the policy file
+    :type save_every: int
+    :param monitor: Analytics to pass the results of each round to, which may stop training early
+    :type monitor: metrics.Monitor
+    :return: Number of games played and seconds taken
+    :rtype: tuple
+    """
+    start = time.perf_counter()
+    deadline = start + seconds if seconds else None
+
+    count = 0
+    rounds = 0
+    with multiprocessing.Pool(workers) as pool:
+        while (games is None or count < games) and (deadline is None or time.perf_counter() < deadline):
+            if games is None or games - count >= sync * workers:
+                batches = [sync] * workers
+            else:
+                # Split the last games so that exactly the number asked for are played
+                share, extra = divmod(games - count, workers)
+                batches = [share + 1] * extra + [share] * (workers - extra)
+            snapshot = freeze(machine.GAMESTATES)
+            seeds = [None if seed is None else seed + rounds * workers + i for i in range(workers)]
+
+            jobs = [(snapshot, batch, worker_seed) for batch, worker_seed in zip(batches, seeds) if batch]
+            for deltas, results in pool.starmap(play_batch, jobs):
+                machine.merge(deltas)
+                if monitor is not None:
+                    monitor.add(*results)
+
+            rounds += 1
+            previous, count = count, count + sum(batches)
+
+            if save_every and count // save_every > previous // save_every:
+                machine.save_policy()
+
+            if monitor is not None and monitor.stopped:
+                break
+
+    return count, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the machine by headless self-play')
+    parser.add_argument('-n', '--games', type=int, help='number of games to play')
+    parser.add_argument('-t', '--seconds', type=float, help='time budget in seconds')
+    parser.add_argument('-s', '--save-every', type=int, default=10000, help='games between saves (0 to disable)')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--sync', type=int, default=1000, help='games each worker plays between merges')
+    parser.add_argument('--seed', type=int, help='base seed for deterministic workers')
+    parser.add_argument('-b', '--batch', type=int, help='play batches of this many games in lockstep with NumPy')
+    parser.add_argument('--size', type=int, default=3, help='number of blocks along each side of the board')
+    parser.add_argument('--win-length', type=int, default=3, help='number of blocks in a row needed to win')
+    parser.add_argument('--memory', type=int,
+                        help='megabytes to hold the states of larger boards in, keeping the rest on disk')
+    parser.add_argument('--metrics', help="file to append training analytics to as JSON lines, or '-' for stderr")
+    parser.add_argument('--metrics-every', type=int, default=10000, help='games between analytics reports')
+    parser.add_argument('--window', type=int, default=1000, help='games the rolling rates average over')
+    parser.add_argument('--stop-draw-rate', type=float, help='stop once the draw rate against the solver reaches this')
+    parser.add_argument('--stop-patience', type=int,
+                        help='stop after this many checks against the solver without improvement')
+    parser.add_argument('--check-every', type=int, default=10000, help='games between checks against the solver')
+    args = parser.parse_args()
+
+    if args.games is None and args.seconds is None:
+        parser.error('one of --games or --seconds is required')
+    if args.batch and (args.size, args.win_length) != (3, 3):
+        parser.error('--batch only supports the 3 x 3 board with 3 in a row')
+    if args.memory is not None and args.workers > 1:
+        parser.error('--memory does not support worker processes')
+
+    stop = None
+    if args.stop_draw_rate is not None or args.stop_patience is not None:
+        if (args.size, args.win_length) != (3, 3):
+            parser.error('early stopping against the solver only supports the 3 x 3 board')
+        stop = metrics.EarlyStop(target=args.stop_draw_rate, patience=args.stop_patience)
+
+    machine.configure(args.size, args.win_length, None if args.memory is None else args.memory << 20)
+    stats.setup({'train': sys.modules[__name__]})
+    machine.load_policy()
+
+    monitor = None
+    if args.metrics or stop is not None:
+        monitor = metrics.Monitor(args.window, args.metrics, args.metrics_every, stop, args.check_every)
+        monitor.start()
+
+    if args.batch:
+        import batch
+        count, elapsed = batch.train(args.games, args.seconds, args.batch, args.seed, args.save_every, monitor)
+    elif args.workers > 1:
+        count, elapsed = train_parallel(args.workers, args.games, args.seconds, args.sync, args.seed,
+                                        args.save_every, monitor)
+    else:
+        random.seed(args.seed)
+        count, elapsed = train(args.games, args.seconds, args.save_every, monitor)
+    machine.save_policy()
+    machine.close_store()
+
+    if monitor is not None:
+        monitor.close()
+        if monitor.stopped:
+            print(f'Stopped early at a draw rate of {stop.rate:.1%} against the solver')
+
+    print(f'Played {count} games in {elapsed:.2f}s ({count / elapsed:.0f} games/s)')
+
+
+if __name__ == '__main__':
+    main()